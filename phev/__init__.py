@@ -1 +1 @@
-__all__ = ['phev', 'units']
\ No newline at end of file
+__all__ = ['phev', 'units', 'orbits']
\ No newline at end of file
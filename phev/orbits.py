@@ -0,0 +1,226 @@
+"""This module computes orbital quantities (separation, orbital energy, eccentricity, period, ...) of pairs of sink particles from Evdf objects."""
+
+import numpy as np
+import pandas as pd
+import phev.phev
+
+
+def _phantom_values(evdf, column_keys):
+    """Returns columns (or index levels) of an Evdf as a (nrows, ncolumns) array in Phantom units."""
+    conv_values = evdf.attrs.get("conv_value", {})
+    values = np.empty((len(evdf), len(column_keys)))
+    for i, column_key in enumerate(column_keys):
+        if column_key in evdf.keys():
+            column = evdf[column_key].to_numpy(dtype=float)
+        else:
+            column = evdf.index.get_level_values(column_key).to_numpy(dtype=float)
+        values[:, i] = column / conv_values.get(column_key, 1)
+    return values
+
+
+def orbital_elements(r, v, mass, axis=-1):
+    """
+    Computes the orbital quantities of two-body orbits from their relative positions and velocities.
+
+    All operations are vectorized over the other dimensions, so whole time series (or
+    (pair, time) blocks of several sink pairs) are processed at once. Inputs and outputs are in
+    Phantom units, where G = 1.
+
+    Parameters
+    ----------
+    r : array-like
+        Relative positions (separation vectors), with the 3 components along axis.
+
+    v : array-like
+        Relative velocities, with the 3 components along axis.
+
+    mass : array-like
+        Total masses of the pairs, with the shape of r without axis.
+
+    axis : int, optional, default=-1
+        Axis of r and v holding the x, y and z components.
+
+    Returns
+    -------
+    elements : dict of numpy.ndarray
+        'separation', 'relative velocity', 'specific orbital energy', 'semi-major axis',
+        'eccentricity' and 'orbital period', with the shape of mass. The semi-major axis is
+        negative for unbound orbits, and their orbital period is NaN.
+    """
+    x, y, z = np.moveaxis(np.asarray(r, dtype=float), axis, 0)
+    vx, vy, vz = np.moveaxis(np.asarray(v, dtype=float), axis, 0)
+    mass = np.asarray(mass, dtype=float)
+
+    separation = np.sqrt(x * x + y * y + z * z)
+    speed_squared = vx * vx + vy * vy + vz * vz
+    energy = 0.5 * speed_squared - mass / separation
+    # Eccentricity vector e = ((v^2 - M/r) r - (r.v) v) / M
+    radial = speed_squared - mass / separation
+    r_dot_v = x * vx + y * vy + z * vz
+    ex = (radial * x - r_dot_v * vx) / mass
+    ey = (radial * y - r_dot_v * vy) / mass
+    ez = (radial * z - r_dot_v * vz) / mass
+    with np.errstate(divide="ignore", invalid="ignore"):
+        semi_major_axis = -mass / (2 * energy)
+        period = np.where(energy < 0, 2 * np.pi * np.sqrt(semi_major_axis**3 / mass), np.nan)
+
+    return {
+        "separation": separation,
+        "relative velocity": np.sqrt(speed_squared),
+        "specific orbital energy": energy,
+        "semi-major axis": semi_major_axis,
+        "eccentricity": np.sqrt(ex * ex + ey * ey + ez * ez),
+        "orbital period": period,
+    }
+
+
+def _orbit_evdf(columns, index=None, units=None):
+    """Builds the Evdf of orbital quantities, with default metadata, in the given units."""
+    evdf = phev.phev.Evdf(columns, index=index)
+    evdf.assign_default_quants_units()
+    if units is not None:
+        evdf.convert_unit_system(units)
+    return evdf
+
+
+def binary_orbit(sink1, sink2, units=None):
+    """
+    Computes the orbit of a pair of sink particles from their two Evdfs (mtSinkXXXXNYY.ev).
+
+    Parameters
+    ----------
+    sink1, sink2 : Evdf
+        Data of the two sinks, with 'time', 'x', 'y', 'z', 'vx', 'vy', 'vz' and 'mass' columns, written
+        at the same times (use phev.phev.evstitch for restarts and phev.phev.evalign for different
+        cadences). The columns may be in any units known by phev.
+
+    units : str or dict, optional, default=None
+        Unit system or units of the result, as in phev.phev.Evdf.convert_unit_system. Default is
+        Phantom units.
+
+    Returns
+    -------
+    evdf : Evdf
+        'time' and the columns of orbital_elements, with the separation vector going from sink1 to
+        sink2. The new columns have physical quantities and units, so they convert like native ones.
+    """
+    keys = ["time", "x", "y", "z", "vx", "vy", "vz", "mass"]
+    values1 = _phantom_values(sink1, keys)
+    values2 = _phantom_values(sink2, keys)
+    if values1.shape != values2.shape or not np.array_equal(values1[:, 0], values2[:, 0]):
+        raise ValueError("The sinks are not written at the same times, align them with evalign first")
+
+    elements = orbital_elements(
+        values2[:, 1:4] - values1[:, 1:4],
+        values2[:, 4:7] - values1[:, 4:7],
+        values1[:, 7] + values2[:, 7],
+    )
+    return _orbit_evdf({"time": values1[:, 0], **elements}, units=units)
+
+
+def sink_orbits(sinks, pairs=None, units=None):
+    """
+    Computes the orbits of pairs of sink particles from the Evdf of all sinks returned by
+    phev.phev.sinkreader.
+
+    The sink data is scattered into one (sink, time) block, and all pairs are computed together
+    with orbital_elements, without a loop over pairs or times.
+
+    Parameters
+    ----------
+    sinks : Evdf
+        Data of the sinks, in the 'multiindex' or 'long' layout of sinkreader.
+
+    pairs : list of tuple of int, optional, default=None
+        Pairs (sink1, sink2) of sink numbers. Default is all the pairs with sink1 < sink2.
+
+    units : str or dict, optional, default=None
+        Unit system or units of the result, as in phev.phev.Evdf.convert_unit_system. Default is
+        Phantom units.
+
+    Returns
+    -------
+    evdf : Evdf
+        Frame indexed by (sink1, sink2), with 'time' and the columns of orbital_elements, at the
+        times where both sinks of a pair have data. The separation vector goes from sink1 to sink2.
+    """
+    keys = ["time", "x", "y", "z", "vx", "vy", "vz", "mass"]
+    values = _phantom_values(sinks, keys)
+    if "sink" in sinks.keys():
+        sink_numbers = sinks["sink"].to_numpy()
+    else:
+        sink_numbers = sinks.index.get_level_values("sink").to_numpy()
+
+    sink_ids, sink_pos = np.unique(sink_numbers, return_inverse=True)
+    times, time_pos = np.unique(values[:, 0], return_inverse=True)
+    # One (quantity, sink, time) block, so each pair is a contiguous (pair, time) slab
+    block = np.full((len(keys) - 1, len(sink_ids), len(times)), np.nan)
+    block[:, sink_pos, time_pos] = values[:, 1:].T
+
+    if pairs is None:
+        first, second = np.triu_indices(len(sink_ids), k=1)
+    else:
+        pairs = np.asarray(pairs, dtype=sink_ids.dtype).reshape(-1, 2)
+        missing = np.setdiff1d(pairs, sink_ids)
+        if len(missing):
+            raise KeyError(f"Sinks {missing.tolist()} not found")
+        first, second = np.searchsorted(sink_ids, pairs.T)
+
+    elements = orbital_elements(
+        block[0:3, second] - block[0:3, first],
+        block[3:6, second] - block[3:6, first],
+        block[6, first] + block[6, second],
+        axis=0,
+    )
+    keep = np.isfinite(elements["separation"]).ravel()
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(sink_ids[first], len(times))[keep], np.repeat(sink_ids[second], len(times))[keep]],
+        names=["sink1", "sink2"],
+    )
+    columns = {"time": np.tile(times, len(first))[keep]}
+    columns.update({key: value.ravel()[keep] for key, value in elements.items()})
+    return _orbit_evdf(columns, index=index, units=units)
+
+
+def separation_orbit(evdf, mass, pair=1, units=None, time_column="time"):
+    """
+    Computes the orbit of a pair from its separation vector (separation_vs_time.ev).
+
+    The relative velocity is the time derivative of the separation vector, computed with second
+    order central differences (numpy.gradient) over the whole time series.
+
+    Parameters
+    ----------
+    evdf : Evdf
+        Data with time and the 'x sep. N', 'y sep. N' and 'z sep. N' columns, with strictly
+        increasing times (use phev.phev.evstitch for restarts).
+
+    mass : float or array-like
+        Total mass of the pair in Phantom mass units, constant or one value per row.
+
+    pair : int, optional, default=1
+        Number N of the pair in the column names.
+
+    units : str or dict, optional, default=None
+        Unit system or units of the result, as in phev.phev.Evdf.convert_unit_system. Default is
+        Phantom units.
+
+    time_column : str, optional, default='time'
+        Time column of the Evdf.
+
+    Returns
+    -------
+    evdf : Evdf
+        Time and the columns of orbital_elements.
+    """
+    keys = [time_column] + [f"{axis} sep. {pair}" for axis in "xyz"]
+    values = _phantom_values(evdf, keys)
+    times = values[:, 0]
+    if len(times) < 2 or np.any(np.diff(times) <= 0):
+        raise ValueError("The relative velocity needs at least two rows with strictly increasing times")
+
+    r = values[:, 1:]
+    v = np.gradient(r, times, axis=0, edge_order=2 if len(times) > 2 else 1)
+    mass = np.broadcast_to(np.asarray(mass, dtype=float), times.shape)
+    elements = orbital_elements(r, v, mass)
+    return _orbit_evdf({time_column: times, **elements}, units=units)
@@ -1,6 +1,23 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import bz2
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import glob
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import lzma
+import os
+import re
+import time
+from multiprocessing import resource_tracker, shared_memory
 import numpy as np
 from matplotlib import rc
 import matplotlib.pyplot as plt
@@ -50,14 +67,44 @@ class Evdf(pd.DataFrame):
         If the unit is not in the predefined list, a custom conversion 
         factor must be provided.
 
+    convert_unit_system(units):
+        Converts several columns at once, to a unit system ('cgs', 'mks', 'phantom')
+        or to the units given in a {column_key: new_units} mapping.
+
+    compact_dtypes(float32=None, integers=True):
+        Stores chosen columns as float32 and integer-valued count and ID
+        columns as integers.
+
+    set_lazy_units(lazy=True):
+        Turns the lazy units mode on or off. In lazy units mode, unit conversions only
+        update the metadata, and columns are scaled when they are read.
+
+    materialize_units():
+        Returns a copy of a lazy units Evdf with all conversions applied to the data.
+
+    evplot(y, x='time', ax=None, bins=None, method='minmax', **kwargs):
+        Plots columns against another column, decimated to the resolution of the plot,
+        with axis labels from the physical quantities and units.
+
     Notes:
     ------
     - This class inherits from pandas.DataFrame and retains all its functionalities.
     - The physical quantities, units, and conversion values are stored in the 
-      `.attrs` dictionary of the DataFrame.
+      `.attrs` dictionary of the DataFrame, as read-only phev.units.FrozenDict objects
+      shared between frames. They are replaced, not modified, when they change.
     - Conversion values are expected to be consistent with the predefined unit dictionary.
+    - In lazy units mode, the data stays in the units given by the `data_conv_value`
+      attribute. Columns read with `evdf[column_key]` (or `evdf.column_key`) are returned
+      in their current units, and so is the data returned or written by `.loc`, `.iloc`, `.at`,
+      `.iat`, `.values`, `.to_numpy()`, `describe()`, the `to_*` export methods, reductions and
+      arithmetic on the whole frame. Values assigned to the Evdf are taken in the current units:
+      a column assigned with `evdf[column_key] = values` is stored in its current units, and
+      other writes (e.g. through `.loc` or `.iloc`) first apply the pending conversions to the
+      stored data.
     """
 
+    units_cache_size = 16
+    _units_cache = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -66,12 +113,104 @@ class Evdf(pd.DataFrame):
     def _constructor(self):
         return Evdf
 
+    def __getitem__(self, key):
+        result = super().__getitem__(key)
+        if isinstance(key, str) and isinstance(result, pd.Series) and self.lazy_units:
+            return self._lazy_column(key, result)
+        return result
+
+    def __setitem__(self, key, value):
+        if not self.lazy_units:
+            return super().__setitem__(key, value)
+        if isinstance(key, str):
+            # The new column is given in the current units, so it is stored in them
+            super().__setitem__(key, value)
+            if key in self.attrs["conv_value"]:
+                self._update_attr("data_conv_value", {key: self.column_conversion_rate(key)})
+        else:
+            self._rebase_units()
+            super().__setitem__(key, value)
+        self._clear_units_cache()
+
+    def _update_inplace(self, result):
+        # Used by the inplace=True methods, which may write into the stored columns
+        super()._update_inplace(result)
+        self._clear_units_cache()
+
+    @property
+    def loc(self):
+        return self._units_indexer("loc")
+
+    @property
+    def iloc(self):
+        return self._units_indexer("iloc")
+
+    @property
+    def at(self):
+        return self._units_indexer("at")
+
+    @property
+    def iat(self):
+        return self._units_indexer("iat")
+
+    def _units_indexer(self, name):
+        """Returns the pandas indexer name of the Evdf, or a _LazyUnitsIndexer if it has pending lazy conversions."""
+        if self._pending_units():
+            return _LazyUnitsIndexer(self, name)
+        return getattr(pd.DataFrame, name).fget(self)
+
+    def _pending_units(self):
+        """True if the Evdf is in lazy units mode and some stored column is not in its current units."""
+        if not self.lazy_units:
+            return False
+        conv_values = self.attrs["conv_value"]
+        return any(
+            conv_values.get(column_key, value) != value
+            for column_key, value in self.attrs["data_conv_value"].items()
+        )
+
+    def _units_factor(self, column_key):
+        """Returns the factor from the stored data of a column to its current units."""
+        conv_value = self.attrs["conv_value"].get(column_key, 1)
+        return conv_value / self.attrs["data_conv_value"].get(column_key, conv_value)
+
+    def _clear_units_cache(self):
+        object.__setattr__(self, "_units_cache", None)
+
+    def _rebase_units(self):
+        """Applies the pending lazy conversions to the stored data, keeping the lazy units mode on."""
+        for column_key in self.attrs["data_conv_value"]:
+            factor = self._units_factor(column_key)
+            if factor != 1:
+                super().__setitem__(column_key, super().__getitem__(column_key).to_numpy() * factor)
+        self.attrs["data_conv_value"] = phev.units.FrozenDict(self.attrs["conv_value"])
+        self._clear_units_cache()
+
+    def _lazy_column(self, column_key, stored):
+        """Returns a stored column scaled to its current units, using an LRU cache of scaled columns."""
+        conv_value = self.attrs["conv_value"].get(column_key, 1)
+        data_conv_value = self.attrs["data_conv_value"].get(column_key, conv_value)
+        if conv_value == data_conv_value:
+            return stored
+        # Writes through the Evdf clear the cache, so the data pointer only tells replaced
+        # columns apart
+        values = stored.to_numpy()
+        data_pointer = values.__array_interface__["data"][0]
+        cache_key = (column_key, conv_value, data_conv_value, data_pointer, len(values))
+        if self._units_cache is None:
+            object.__setattr__(self, "_units_cache", collections.OrderedDict())
+        if cache_key in self._units_cache:
+            self._units_cache.move_to_end(cache_key)
+            return self._units_cache[cache_key]
+        scaled = stored * (conv_value / data_conv_value)
+        self._units_cache[cache_key] = scaled
+        while len(self._units_cache) > self.units_cache_size:
+            self._units_cache.popitem(last=False)
+        return scaled
+
     def assign_default_quants_units(self):
         """Assigns default physical quantities, units, and conversion values to Evdf attributes."""
-        quants_atr, units_atr, conv_value_atr = {}, {}, {}
-        for column_key in self.keys():
-            default_qu = phev.units.phys_quants_units_default(column_key)
-            quants_atr[column_key], units_atr[column_key], conv_value_atr[column_key] = default_qu
+        quants_atr, units_atr, conv_value_atr = phev.units.columns_metadata(tuple(self.keys()))
 
         self.attrs.update(
             {
@@ -81,6 +220,63 @@ class Evdf(pd.DataFrame):
             }
         )
 
+    @property
+    def lazy_units(self):
+        """True if the Evdf is in lazy units mode."""
+        return "data_conv_value" in self.attrs
+
+    def set_lazy_units(self, lazy:bool=True):
+        """It allow to turn the lazy units mode of the Ev DataFrame on or off.
+
+        In lazy units mode, convert_units and convert_unit_system only record the new units and
+        conversion values, and the stored data is never rewritten. A column is scaled when it is
+        read with evdf[column_key], and the scaled column is cached per (column, units). Switching
+        units is then O(1), and repeated conversions do not accumulate rounding errors.
+
+        Parameters
+        ----------
+        lazy : bool
+            If True, turns the lazy units mode on. If False, applies the pending conversions to the
+            stored data and turns the mode off. Default is True.
+
+        """
+        if lazy and not self.lazy_units:
+            self.attrs["data_conv_value"] = phev.units.FrozenDict(self.attrs["conv_value"])
+        elif not lazy and self.lazy_units:
+            self._rebase_units()
+            del self.attrs["data_conv_value"]
+
+    def materialize_units(self):
+        """Returns a copy of the Ev DataFrame with all pending lazy unit conversions applied to the data."""
+        evdf = self.copy()
+        evdf.set_lazy_units(False)
+        return evdf
+
+    def _materialized(self):
+        """Returns the Ev DataFrame itself, or a materialized copy if it is in lazy units mode."""
+        return self.materialize_units() if self.lazy_units else self
+
+    @property
+    def values(self):
+        """The data of the Ev DataFrame as a numpy array, in the current units."""
+        return pd.DataFrame.values.fget(self._materialized())
+
+    def _rescale_column(self, column_key, new_conversion_val):
+        """Sets the conversion value of a column, rescaling its data unless the lazy units mode is on."""
+        if self.lazy_units:
+            if column_key not in self.attrs["data_conv_value"]:
+                data_conv_value = {column_key: self.column_conversion_rate(column_key)}
+                self._update_attr("data_conv_value", data_conv_value)
+            self._update_attr("conv_value", {column_key: new_conversion_val})
+            return None
+        self[column_key] = self[column_key] / self.column_conversion_rate(column_key)
+        self._update_attr("conv_value", {column_key: new_conversion_val})
+        self[column_key] = self[column_key] * new_conversion_val
+
+    def _update_attr(self, attr, mapping):
+        """Replaces an attribute of the Evdf by a FrozenDict with the entries of mapping added or replaced."""
+        self.attrs[attr] = phev.units.FrozenDict({**self.attrs.get(attr, {}), **mapping})
+
     def column_units(self, column_key):
         """Returns the unit associated with a given column key."""
         return self.attrs["units"].get(column_key, None)
@@ -95,7 +291,7 @@ class Evdf(pd.DataFrame):
 
     def edit_physical_quantity(self, column_key:str, new_quantity_name:str):
         """It allow to edit the tag of physical quantity in a given column of the Ev DataFrame."""
-        self.attrs["phys_quantity"].update({column_key: new_quantity_name})
+        self._update_attr("phys_quantity", {column_key: new_quantity_name})
 
     def convert_units(self, column_key:str, new_units:str, new_conversion_val:float=0, warning_new_conv_val:bool=True): 
         """It allow to edit the tag of physical units in a given column of the Ev DataFrame.
@@ -125,17 +321,13 @@ class Evdf(pd.DataFrame):
 
 
         if quants_and_unit_stored:
-            self.attrs["units"].update({column_key: new_units})
+            self._update_attr("units", {column_key: new_units})
             new_conversion_val = phev.units.merged_units_dict[new_units] 
-            self[column_key] = self[column_key] / self.column_conversion_rate(column_key)            
-            self.attrs["conv_value"].update({column_key: new_conversion_val})
-            self[column_key] = self[column_key] * new_conversion_val 
+            self._rescale_column(column_key, new_conversion_val)
             return None
         elif phys_quants in units_dict.keys() and new_conversion_val > 0:
-            self.attrs["units"].update({column_key: new_units})
-            self[column_key] = self[column_key] / self.column_conversion_rate(column_key)
-            self.attrs["conv_value"].update({column_key: new_conversion_val})
-            self[column_key] = self[column_key] * new_conversion_val 
+            self._update_attr("units", {column_key: new_units})
+            self._rescale_column(column_key, new_conversion_val)
             if warning_new_conv_val:
                 warnings.warn(f"Warning: '{new_units}' not found in unit list. Changes are made to new unit by user.", stacklevel=2)
             return None
@@ -143,47 +335,355 @@ class Evdf(pd.DataFrame):
             raise ValueError("Invalid conversion value")
             return None
 
+    def convert_unit_system(self, units):
+        """It allow to convert several columns of the Ev DataFrame to new units in a single pass.
+
+        One combined factor (new conversion value / current conversion value) is computed per
+        column, and each column is rewritten once. All new units are validated before any column
+        is changed, so the data and the units and conv_value attributes are updated together.
+
+        Parameters
+        ----------
+        units : string or dict
+            Name of a unit system in phev.units.unit_systems ('cgs', 'mks' or 'phantom'), or a
+            mapping {column_key: new_units}. With a unit system, every column whose physical
+            quantity is recognised is converted, and the others are left unchanged. In a mapping,
+            new_units may also be a (new_units, new_conversion_val) tuple for units that are not
+            recognised by phev (see convert_units).
+
+        """
+        if isinstance(units, str):
+            if units not in phev.units.unit_systems:
+                raise ValueError(
+                    f"Unknown unit system '{units}'. Options are {list(phev.units.unit_systems)}"
+                )
+            system = phev.units.unit_systems[units]
+            units = {}
+            for column_key in self.keys():
+                phys_quants = self.column_physical_quantity(column_key)
+                if phys_quants in system:
+                    units[column_key] = system[phys_quants]
+
+        new_units, new_conv_values = {}, {}
+        for column_key, unit in units.items():
+            if column_key not in self.keys():
+                raise KeyError(f"Column '{column_key}' not found")
+            if isinstance(unit, tuple):
+                unit, new_conversion_val = unit
+                if new_conversion_val <= 0:
+                    raise ValueError("Invalid conversion value")
+            else:
+                phys_quants = self.column_physical_quantity(column_key)
+                units_dict = phev.units.quantity_units_dicts.get(phys_quants, {})
+                if unit not in units_dict:
+                    raise ValueError(f"Unknown units '{unit}' for column '{column_key}' ({phys_quants})")
+                new_conversion_val = units_dict[unit]
+            new_units[column_key] = unit
+            new_conv_values[column_key] = new_conversion_val
+
+        if self.lazy_units:
+            data_conv_value = {
+                column_key: self.column_conversion_rate(column_key)
+                for column_key in new_conv_values
+                if column_key not in self.attrs["data_conv_value"]
+            }
+            self._update_attr("data_conv_value", data_conv_value)
+        else:
+            self._scale_columns(
+                {
+                    column_key: new_conversion_val / self.column_conversion_rate(column_key)
+                    for column_key, new_conversion_val in new_conv_values.items()
+                }
+            )
+        self._update_attr("units", new_units)
+        self._update_attr("conv_value", new_conv_values)
+
+    def _scale_columns(self, factors):
+        """
+        Multiplies columns of the Ev DataFrame by the factors {column_key: factor}.
+
+        The columns of each float block (e.g. the single block of an Evdf read by evreader) are
+        scaled in place by one vector of factors, so the block is neither copied per column nor
+        split. A block shared with another frame or read-only is copied once first. Other columns
+        are reassigned one by one.
+        """
+        factors = {k: f for k, f in factors.items() if f != 1}
+        if not factors:
+            return None
+        if self.columns.is_unique:
+            scale = np.array([factors.get(k, 1.0) for k in self.columns])
+
+            def float_blocks():
+                for block in self._mgr.blocks:
+                    locs = block.mgr_locs.as_array
+                    values = block.values
+                    if (scale[locs] != 1).any() and isinstance(values, np.ndarray) and values.dtype.kind == "f":
+                        yield block, locs, values
+
+            if any(
+                not values.flags.writeable or block.refs.has_reference()
+                for block, _, values in float_blocks()
+            ):
+                self._update_inplace(self.copy())
+            for _, locs, values in float_blocks():
+                values *= scale[locs][:, np.newaxis]
+                factors = {k: f for k, f in factors.items() if k not in set(self.columns[locs])}
+            self._clear_units_cache()
+        for column_key, factor in factors.items():
+            self[column_key] = self[column_key].to_numpy() * factor
+
+    def compact_dtypes(self, float32=None, integers:bool=True):
+        """It allow to reduce the memory of the Ev DataFrame by changing the dtype of its float64 columns.
+
+        Parameters
+        ----------
+        float32 : bool or list of str, optional
+            Columns to store as float32, given as column names and/or physical quantities
+            (e.g. ['energy', 'angular momentum']). If True, all columns except those with
+            physical quantity 'time' are stored as float32. Default is None (no float32 columns).
+
+        integers : bool
+            If True, count and ID columns (see phev.units.is_count_column) whose values are all
+            integers are stored as int32, or int64 if they do not fit. Default is True.
+
+        """
+        for column_key in list(self.keys()):
+            # The stored data, not the column scaled to its current units in lazy units mode
+            values = super().__getitem__(column_key).to_numpy()
+            if values.dtype != np.float64:
+                continue
+            quantity = self.column_physical_quantity(column_key)
+            if integers and phev.units.is_count_column(column_key):
+                if np.isfinite(values).all() and np.array_equal(values, np.trunc(values)):
+                    int32_info = np.iinfo(np.int32)
+                    fits_int32 = len(values) == 0 or (
+                        values.min() >= int32_info.min and values.max() <= int32_info.max
+                    )
+                    super().__setitem__(column_key, values.astype(np.int32 if fits_int32 else np.int64))
+                    continue
+            if float32 is True:
+                to_float32 = quantity != "time"
+            else:
+                to_float32 = bool(float32) and (column_key in float32 or quantity in float32)
+            if to_float32:
+                super().__setitem__(column_key, values.astype(np.float32))
+
+
+    def evplot(self, y, x="time", ax=None, bins=None, method="minmax", **kwargs):
+        """It allow to plot columns of the Ev DataFrame against another column, decimated to the resolution of the plot.
+
+        Each series is reduced with phev.phev.decimate before it is drawn, so plots of millions of
+        rows are drawn in milliseconds while peaks and jumps stay visible. When the x range of the
+        axes changes (e.g. zooming in an interactive window), the visible part of the full series
+        is decimated again. The axes are labelled with the physical quantities and units of the columns.
+
+        Parameters
+        ----------
+        y : string or list of strings
+            Columns to plot.
+
+        x : string
+            Column of the horizontal axis. Default is 'time'.
+
+        ax : matplotlib.axes.Axes, optional
+            Axes to plot on. Default is the axes of a new figure.
+
+        bins : int, optional
+            Number of buckets each series is reduced to. Default is the width of the axes in pixels.
+
+        method : string
+            Decimation method, 'minmax' (default) or 'lttb'. See phev.phev.decimate.
+
+        **kwargs
+            Keyword arguments passed to matplotlib.axes.Axes.plot.
+
+        Returns
+        -------
+        ax : matplotlib.axes.Axes
+            Axes with the plotted columns.
+        """
+        columns = [y] if isinstance(y, str) else list(y)
+        if ax is None:
+            _, ax = plt.subplots()
+        if bins is None:
+            bins = max(int(ax.get_window_extent().width), 1)
+
+        x_values = self[x].to_numpy(np.float64)
+        order = None
+        if len(x_values) > 1 and not (np.diff(x_values) >= 0).all():
+            order = np.argsort(x_values, kind="stable")
+            x_values = x_values[order]
+        lines = []
+        for column_key in columns:
+            y_values = self[column_key].to_numpy(np.float64)
+            if order is not None:
+                y_values = y_values[order]
+            line = ax.plot(*decimate(x_values, y_values, bins, method), label=column_key, **kwargs)[0]
+            lines.append((line, y_values))
+
+        def redecimate(ax):
+            first, last = np.searchsorted(x_values, sorted(ax.get_xlim()))
+            visible = slice(max(first - 1, 0), last + 1)
+            for line, y_values in lines:
+                line.set_data(*decimate(x_values[visible], y_values[visible], bins, method))
+
+        ax.callbacks.connect("xlim_changed", redecimate)
+        ax.set_xlabel(_axis_label(self, [x]))
+        ax.set_ylabel(_axis_label(self, columns))
+        if len(columns) > 1:
+            ax.legend()
+        return ax
 
-def evreader(filename, pheaders=True):
+
+class _LazyUnitsIndexer:
+    """
+    Indexer (.loc, .iloc, .at or .iat) of an Evdf with pending lazy unit conversions. Reads return
+    the data in the current units, as evdf[column_key] does. Writes take values in the current
+    units, so the pending conversions are applied to the stored data first.
     """
-    Reads an .ev file and converts its columns and rows into an Evdf (extended pandas DataFrame) object.
 
-    Parameters
-    ----------
-    filename : str
-        Path to the .ev file. The file must remain unchanged from the moment it was created by Phantom.
+    def __init__(self, evdf, name):
+        self._evdf = evdf
+        self._name = name
 
-    pheaders : bool, optional, default=True
-        If True, prints the column names after removing the brackets characteristic of the .ev file.
+    def _indexer(self):
+        return getattr(pd.DataFrame, self._name).fget(self._evdf)
 
-    Returns
-    -------
-    evdf : Evdf
-        A DataFrame-like object containing the parsed data, with assigned physical quantities and units.
+    def __getitem__(self, key):
+        if self._name in ("at", "iat"):
+            column_key = key[1] if self._name == "at" else self._evdf.columns[key[1]]
+            factor = self._evdf._units_factor(column_key)
+            value = self._indexer()[key]
+            return value * factor if factor != 1 else value
+        return getattr(self._evdf.materialize_units(), self._name)[key]
+
+    def __setitem__(self, key, value):
+        self._evdf._rebase_units()
+        self._indexer()[key] = value
+
+    def __call__(self, *args, **kwargs):
+        self._evdf._rebase_units()
+        return self._indexer()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        self._evdf._rebase_units()
+        return getattr(self._indexer(), attr)
+
+
+def _materialized_method(name):
+    """Returns a pandas.DataFrame method that runs on Evdfs with their pending lazy unit conversions applied."""
+    method = getattr(pd.DataFrame, name)
+
+    @functools.wraps(method)
+    def materialized(self, *args, **kwargs):
+        args = [arg._materialized() if isinstance(arg, Evdf) else arg for arg in args]
+        return method(self._materialized(), *args, **kwargs)
+
+    return materialized
+
+
+# Methods that export the data of an Evdf or compute with the whole frame. In lazy units mode,
+# they must see the data in the current units, as recorded in the attrs
+for _name in [
+    "__array__",
+    "to_numpy",
+    "describe",
+    "_reduce",
+    "_arith_method",
+    "_cmp_method",
+    "_logical_method",
+    "to_csv",
+    "to_json",
+    "to_parquet",
+    "to_feather",
+    "to_orc",
+    "to_hdf",
+    "to_excel",
+    "to_sql",
+    "to_stata",
+    "to_pickle",
+    "to_clipboard",
+    "to_dict",
+    "to_records",
+    "to_string",
+    "to_html",
+    "to_latex",
+    "to_markdown",
+    "to_xml",
+]:
+    if hasattr(pd.DataFrame, _name):
+        setattr(Evdf, _name, _materialized_method(_name))
+del _name
+
+
+# Magic bytes of the compressed formats read by the .ev readers, and their modules
+_COMPRESSION_MAGIC = [(b"\x1f\x8b", gzip), (b"BZh", bz2), (b"\xfd7zXZ\x00", lzma)]
+
+
+def _compression_module(source):
+    """
+    Returns the module (gzip, bz2 or lzma) that decompresses a file, given its path or its first
+    bytes, or None if it is not compressed.
     """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            source = f.read(6)
+    for magic, module in _COMPRESSION_MAGIC:
+        if source.startswith(magic):
+            return module
+    return None
 
-    f = open(filename, "r")
-    raw_data = f.read().split("\n")
-    f.close()
-    Row1 = raw_data[0]
-    ncols = len(Row1.split("]")) - 1
-    (
-        headers,
-        columns,
-    ) = (
-        [],
-        [],
-    )
-    for i in Row1.split("]")[:-1]:
-        columns.append([])
+
+@contextlib.contextmanager
+def _open_ev(source):
+    """
+    Opens an .ev file (a path, or a text or binary file object) for reading as text. gzip, bz2
+    and xz files, detected by their magic bytes, are decompressed as they are read, without
+    holding the whole text. File objects are left open.
+    """
+    if isinstance(source, io.TextIOBase):
+        yield source
+    elif hasattr(source, "read"):
+        # Buffered wrapper for peeking, detached at the end so it never closes the source
+        wrapper = None if hasattr(source, "peek") else io.BufferedReader(source)
+        binary = source if wrapper is None else wrapper
+        module, stream, text = None, None, None
+        try:
+            module = _compression_module(binary.peek(6)[:6])
+            stream = module.open(binary, "rb") if module is not None else binary
+            text = io.TextIOWrapper(stream)
+            yield text
+        finally:
+            if text is not None:
+                text.detach()
+            if module is not None and stream is not None:
+                stream.close()
+            if wrapper is not None:
+                wrapper.detach()
+    else:
+        module = _compression_module(source)
+        with (open(source, "r") if module is None else module.open(source, "rt")) as f:
+            yield f
+
+
+def _parse_headers(header_line):
+    """Returns the column names of an .ev header line, removing the brackets and column numbers."""
+    headers = []
+    for i in header_line.split("]")[:-1]:
         headers.append(
             i.strip("#").strip().strip("[").strip().lstrip("1234567890").strip()
         )
+    return headers
 
-    if pheaders == True:
-        print(headers)
 
-    for i in raw_data[1:]:
+def _parse_body_fields(raw_lines, ncols):
+    """
+    Parses the data body of an .ev file field by field. Fields that cannot be converted
+    to float are kept as strings. This is the slow path used when the body is not a purely
+    numeric block.
+    """
+    columns = [[] for _ in range(ncols)]
+    for i in raw_lines:
         if i.strip() == "":
             continue
         S = i
@@ -201,19 +701,2559 @@ def evreader(filename, pheaders=True):
                     columns[j].append(S)
             S = S[S.find(" ") :]
 
-    formatted_columns = []
-    for col in enumerate(columns):
-        formatted_columns.append(np.array(col[1]))
+    return [np.array(col) for col in columns]
 
-    Data = {}
 
-    for h, c in zip(headers, formatted_columns):
+def _resolve_usecols(headers, usecols):
+    """
+    Returns the sorted 0-based indices of the columns selected by usecols, given as header names
+    or 1-based column numbers as they appear in the header. Returns None if usecols is None.
+    """
+    if usecols is None:
+        return None
+    if isinstance(usecols, (str, int)):
+        usecols = [usecols]
+    indices = set()
+    for col in usecols:
+        if isinstance(col, (int, np.integer)) and not isinstance(col, bool):
+            if not 1 <= col <= len(headers):
+                raise ValueError(f"Column number {col} out of range 1-{len(headers)}")
+            indices.add(int(col) - 1)
+        elif col in headers:
+            indices.add(headers.index(col))
+        else:
+            raise ValueError(f"Column '{col}' not found in headers {headers}")
+    return sorted(indices)
+
+
+def _parse_body(lines, ncols, usecols=None):
+    """
+    Parses the whitespace-delimited numeric block of an .ev file with numpy's C parser.
+
+    Parameters
+    ----------
+    lines : file object or iterable of str
+        Data lines of the .ev file (without the header line).
+
+    ncols : int
+        Number of columns declared in the header.
+
+    usecols : list of int, optional
+        Sorted 0-based indices of the columns to convert. Other fields are skipped and never
+        converted to float, except the first one, which is always converted so that header
+        lines in the middle of the data ('#' first field) are detected. Default is all columns.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        2-D float64 array of shape (nrows, ncols), or (nrows, len(usecols)).
+
+    Raises
+    ------
+    ValueError
+        If any field is not a number or the rows do not have ncols fields.
+    """
+    drop_first = usecols is not None and (len(usecols) == 0 or usecols[0] != 0)
+    if drop_first:
+        usecols = [0] + list(usecols)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # empty body
+        data = np.loadtxt(lines, dtype=np.float64, comments=None, ndmin=2, usecols=usecols)
+    if drop_first:
+        usecols = usecols[1:]
+        data = data[:, 1:]
+    if usecols is not None:
+        ncols = len(usecols)
+    if data.size == 0:
+        return np.empty((0, ncols), dtype=np.float64)
+    if data.shape[1] != ncols:
+        raise ValueError(f"Expected {ncols} columns, found {data.shape[1]}")
+    return data
+
+
+# Marks of the fields that Phantom's Fortran output writes in a form that float() cannot parse:
+# overflow markers ('*****'), exponents without E ('1.234567890-105') and D exponents ('1.5D+03')
+_BAD_FIELD_MARK = re.compile(r"\*|\d[+-]\d|\d[dD][+-]?\d")
+_FORTRAN_EXPONENT = re.compile(r"([+-]?[\d.]+)([+-]\d+)")
+_WHITESPACE = re.compile(r"\s")
+
+
+def _repair_field(field):
+    """Returns a parsable version of a Fortran number, or 'nan' for overflow markers and fields that cannot be repaired."""
+    if "*" in field:
+        return "nan"
+    field = field.replace("D", "E").replace("d", "E")
+    match = _FORTRAN_EXPONENT.fullmatch(field)
+    if match is not None:
+        field = f"{match.group(1)}E{match.group(2)}"
+    try:
+        float(field)
+    except ValueError:
+        return "nan"
+    return field
+
+
+def _find_bad_field_marks(text):
+    """Returns the positions in text of the marks of Fortran-formatted fields (see _BAD_FIELD_MARK)."""
+    try:
+        b = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        return [match.start() for match in _BAD_FIELD_MARK.finditer(text)]
+    digit = (b >= ord("0")) & (b <= ord("9"))
+    marks = b == ord("*")
+    marks[:-2] |= digit[:-2] & ((b[1:-1] == ord("+")) | (b[1:-1] == ord("-"))) & digit[2:]
+    marks[:-1] |= digit[:-1] & ((b[1:] == ord("D")) | (b[1:] == ord("d")))
+    return np.flatnonzero(marks).tolist()
+
+
+def _repair_body(text, headers):
+    """
+    Repairs the Fortran-formatted fields of the data body of an .ev file.
+
+    The fields are located with a single regular expression scan of the text, so only the
+    rows that contain them are touched. Fortran exponents are repaired and overflow markers
+    are replaced by nan.
+
+    Returns
+    -------
+    text : str
+        Repaired data body.
+
+    repaired_values : dict
+        Number of repaired fields per column name.
+    """
+    counts = collections.Counter()
+    pieces = []
+    end = 0
+    for mark in _find_bad_field_marks(text):
+        if mark < end:
+            continue  # mark inside a field that was already repaired
+        start = mark
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        next_space = _WHITESPACE.search(text, mark)
+        line_start = text.rfind("\n", 0, start) + 1
+        counts[len(text[line_start:start].split())] += 1
+        pieces.append(text[end:start])
+        end = len(text) if next_space is None else next_space.start()
+        pieces.append(_repair_field(text[start:end]))
+
+    if pieces:
+        pieces.append(text[end:])
+        text = "".join(pieces)
+    return text, {headers[i]: n for i, n in sorted(counts.items()) if i < len(headers)}
+
+
+def _parse_body_fallback(text, headers, usecols, repair, strict, filename, err):
+    """
+    Parses a data body that failed the fast path. If repair is True, the Fortran-formatted
+    fields are repaired and the fast path is tried again. Otherwise (or if it fails again),
+    raises a ValueError in strict mode, or parses the body field by field.
+
+    Returns
+    -------
+    data : numpy.ndarray or None
+        2-D float64 array of the parsed columns, or None if the body was parsed field by field.
+
+    columns : list of numpy.ndarray
+        The parsed columns.
+
+    repaired_values : dict
+        Number of repaired fields per column name.
+    """
+    repaired_values = {}
+    if repair:
+        text, repaired_values = _repair_body(text, headers)
+        try:
+            data = _parse_body(text.split("\n"), len(headers), usecols)
+            return data, data.T, repaired_values
+        except ValueError as repair_err:
+            err = repair_err
+    if strict:
+        raise ValueError(f"Non-numeric data in '{filename}': {err}") from err
+    columns = _parse_body_fields(text.split("\n"), len(headers))
+    if usecols is not None:
+        columns = [columns[i] for i in usecols]
+    return None, columns, repaired_values
+
+
+# Header lines ('# [ 1 time] ...') written in the middle of the data body by restarts
+_HEADER_LINE = re.compile(r"^[ \t]*#.*$", re.MULTILINE)
+
+
+def _has_header_lines(text):
+    """Returns True if the data body text contains header lines."""
+    return "#" in text and _HEADER_LINE.search(text) is not None
+
+
+def _split_segments(text, headers):
+    """
+    Splits a data body at its header lines.
+
+    Returns
+    -------
+    segments : list of (list of str, str)
+        Headers and data body text of each segment. The first segment uses the given headers.
+    """
+    segments = []
+    start = 0
+    for match in _HEADER_LINE.finditer(text):
+        segments.append((headers, text[start : match.start()]))
+        headers = _parse_headers(match.group())
+        start = match.end()
+    segments.append((headers, text[start:]))
+    return segments
+
+
+def _parse_segments(text, headers, names, repair, strict, filename):
+    """
+    Parses a data body with header lines in the middle (multi-segment .ev file).
+
+    Each segment is parsed on the fast path with its own headers, and the segments are merged
+    by column name. Columns missing from a segment are filled with NaN.
+
+    Parameters
+    ----------
+    names : list of str or None
+        Names of the columns to keep, or None for all columns.
+
+    Returns
+    -------
+    merged_headers : list of str
+        Column names of the merged data, in order of first appearance (or in the order of names).
+
+    columns : list of numpy.ndarray
+        The merged columns.
+
+    repaired_values : dict
+        Number of repaired fields per column name.
+
+    last_headers : list of str
+        Headers of the last segment.
+    """
+    frames = []
+    repaired_values = collections.Counter()
+    segments = _split_segments(text, headers)
+    for seg_headers, body in segments:
+        usecols = None
+        if names is not None:
+            usecols = [i for i, h in enumerate(seg_headers) if h in names] or [0]
+        try:
+            columns = _parse_body(body.split("\n"), len(seg_headers), usecols).T
+        except ValueError as err:
+            _, columns, seg_repairs = _parse_body_fallback(
+                body, seg_headers, usecols, repair, strict, filename, err
+            )
+            repaired_values.update(seg_repairs)
+        seg_names = seg_headers if usecols is None else [seg_headers[i] for i in usecols]
+        frame = pd.DataFrame(dict(zip(seg_names, columns)))
+        if len(frame) > 0:
+            frames.append(frame)
+
+    if frames:
+        merged = pd.concat(frames, ignore_index=True)
+    else:
+        merged = pd.DataFrame(columns=headers, dtype=np.float64)
+    if names is not None:
+        merged = merged.reindex(columns=names)
+    merged_headers = list(merged.keys())
+    columns = [merged[h].to_numpy() for h in merged_headers]
+    return merged_headers, columns, dict(repaired_values), segments[-1][0]
+
+
+def _report_repairs(evdf, repaired_values, filename):
+    """Stores the number of repaired fields per column in the attrs of an Evdf and warns about them."""
+    repaired_values = {h: n for h, n in repaired_values.items() if h in evdf.keys()}
+    if repaired_values:
+        evdf.attrs["repaired_values"] = phev.units.FrozenDict(repaired_values)
+        warnings.warn(
+            f"Repaired {sum(repaired_values.values())} Fortran-formatted values in '{filename}': "
+            f"{repaired_values}",
+            stacklevel=3,
+        )
+
+
+def _build_evdf(headers, columns):
+    """
+    Builds an Evdf from the column names and their arrays, and assigns default quantities and units.
+
+    If columns is a 2-D array of shape (ncols, nrows), such as the transpose of the array parsed
+    by _parse_body, it is wrapped as the single block of the Evdf without copying.
+    """
+    if (
+        isinstance(columns, np.ndarray)
+        and columns.ndim == 2
+        and columns.shape[0] == len(headers)
+        and len(set(headers)) == len(headers)
+    ):
+        Data = Evdf(columns.T, columns=headers, copy=False)
+        Data.assign_default_quants_units()
+        return Data
+
+    Data = {}
+    for h, c in zip(headers, columns):
         Data.update({h: c})
     Data = Evdf(Data)
     Data.assign_default_quants_units()
     return Data
 
 
+class EvCache:
+    """
+    Binary cache of parsed .ev files.
+
+    Each cached file is stored as a pair of sidecars in the cache directory: a .npy file with the
+    parsed columns as one 2-D float64 array, and a .json file with the headers and the
+    phys_quantity, units and conv_value attributes. Cached data is memory mapped back
+    (copy-on-write), so loading does not copy or re-parse the data.
+
+    Entries are keyed by the absolute path and a hash of the whole content of the .ev file, so
+    any change to the file invalidates its entry. When the cache grows beyond
+    size_limit, the least recently used entries are removed.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory where the sidecars are stored. Default is the PHEV_CACHE_DIR environment
+        variable or, if it is not set, ~/.cache/phev.
+
+    size_limit : int, optional, default=2**30
+        Maximum total size of the cache in bytes.
+    """
+
+    # Size of the blocks read to hash the .ev files
+    hash_block_size = 2**20
+
+    def __init__(self, cache_dir=None, size_limit=2**30):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                "PHEV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "phev")
+            )
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, filename):
+        """
+        Returns the cache key of an .ev file, from its absolute path and the hash of its whole
+        content, so any change to the file (even one that keeps its size and modification time,
+        e.g. with cp -p or rsync -t) gives a new key.
+        """
+        path = os.path.abspath(filename)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{path}|".encode())
+        digest.update(_file_digest(path, self.hash_block_size).encode())
+        return digest.hexdigest()
+
+    def _entry_paths(self, key):
+        return (
+            os.path.join(self.cache_dir, key + ".npy"),
+            os.path.join(self.cache_dir, key + ".json"),
+        )
+
+    def load(self, filename, key=None):
+        """
+        Returns the cached Evdf of an .ev file, or None if the file is not cached. key is the cache
+        key of the file, computed with EvCache.key if it is not given.
+        """
+        data_path, meta_path = self._entry_paths(self.key(filename) if key is None else key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            data = np.load(data_path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        for path in (data_path, meta_path):
+            os.utime(path, (now, now))
+
+        evdf = Evdf(data, columns=meta["headers"], copy=False)
+        for attr, values in meta["attrs"].items():
+            evdf.attrs[attr] = phev.units.FrozenDict(values)
+        return evdf
+
+    def store(self, filename, headers, data, attrs, key=None):
+        """
+        Stores the parsed 2-D data array, headers and attributes of an .ev file in the cache. key
+        should be the cache key of the file computed before it was parsed, so that data parsed
+        from an older version of a file that was changed meanwhile is never stored under the key
+        of the new version.
+        """
+        data_path, meta_path = self._entry_paths(self.key(filename) if key is None else key)
+        meta = {"filename": os.path.abspath(filename), "headers": headers, "attrs": attrs}
+        tmp_path = data_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(data, dtype=np.float64))
+        os.replace(tmp_path, data_path)
+        tmp_path = meta_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, default=float)
+        os.replace(tmp_path, meta_path)
+        self.evict()
+
+    def entries(self):
+        """Returns the cache entries as a list of (key, size in bytes, last access time), oldest first."""
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext not in (".npy", ".json"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            size, atime = entries.get(key, (0, 0.0))
+            entries[key] = (size + stat.st_size, max(atime, stat.st_mtime))
+        return sorted(
+            ((k, size, atime) for k, (size, atime) in entries.items()), key=lambda e: e[2]
+        )
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is within size_limit."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.size_limit:
+                break
+            for path in self._entry_paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for key, _, _ in self.entries():
+            for path in self._entry_paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _split_byte_ranges(filename, start, nranges):
+    """Splits the bytes of a file from start to its end into nranges ranges aligned to line boundaries."""
+    size = os.path.getsize(filename)
+    bounds = [start]
+    with open(filename, "rb") as f:
+        for k in range(1, nranges):
+            f.seek(max(start + (size - start) * k // nranges - 1, bounds[-1]))
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def _read_byte_range(filename, start, end):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _count_rows(filename, start, end):
+    """Returns the number of non-empty lines in a byte range of a file."""
+    block = np.frombuffer(_read_byte_range(filename, start, end), dtype=np.uint8)
+    ends = np.flatnonzero(block == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    nrows = int(np.count_nonzero(ends > starts))
+    last = ends[-1] + 1 if len(ends) else 0
+    return nrows + int(last < len(block))
+
+
+def _parse_byte_range(filename, start, end, ncols, usecols, shm_name, shape, row_offset, nrows):
+    """
+    Parses a byte range of the data body of an .ev file and writes the rows into the shared
+    memory block shm_name, which holds a float64 array of the given shape, from row_offset.
+    """
+    lines = _read_byte_range(filename, start, end).decode().split("\n")
+    data = _parse_body(lines, ncols, usecols)
+    if len(data) != nrows:
+        raise ValueError(f"Expected {nrows} rows in bytes {start}-{end}, found {len(data)}")
+    # The block belongs to the parent process, which unlinks it. The workers share its resource
+    # tracker, so they must not unregister it
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        out[row_offset : row_offset + nrows] = data
+        del out
+    finally:
+        shm.close()
+
+
+def _parse_body_parallel(filename, ncols, usecols, workers):
+    """
+    Parses the data body of an .ev file in a process pool, splitting it into byte ranges
+    aligned to line boundaries. Each worker counts the rows of its range, and then parses them
+    directly into a shared memory block, so the parsed arrays are never pickled.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        2-D float64 array, identical to the result of _parse_body on the whole body.
+
+    Raises
+    ------
+    ValueError
+        If any range is not a purely numeric block.
+    """
+    with open(filename, "rb") as f:
+        body_start = len(f.readline())
+    ranges = _split_byte_ranges(filename, body_start, workers)
+    width = ncols if usecols is None else len(usecols)
+    # Start the resource tracker before the workers, so they share it with this process
+    resource_tracker.ensure_running()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        nrows = list(executor.map(_count_rows, *zip(*[(filename, a, b) for a, b in ranges])))
+        shape = (sum(nrows), width)
+        shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+        try:
+            row_offsets = np.concatenate(([0], np.cumsum(nrows)[:-1])).tolist()
+            futures = [
+                executor.submit(
+                    _parse_byte_range, filename, a, b, ncols, usecols, shm.name, shape, offset, n
+                )
+                for (a, b), offset, n in zip(ranges, row_offsets, nrows)
+            ]
+            for future in futures:
+                future.result()
+            shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            data = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+    return data
+
+
+def _select_columns(evdf, headers):
+    """Returns the given columns of an Evdf, keeping only their physical quantities and units in attrs."""
+    attrs = {
+        attr: phev.units.FrozenDict({h: values[h] for h in headers if h in values})
+        for attr, values in evdf.attrs.items()
+    }
+    evdf = evdf[headers]
+    evdf.attrs = attrs
+    return evdf
+
+
+def evreader(
+    filename,
+    pheaders=True,
+    cache=None,
+    usecols=None,
+    time_range=None,
+    float32=None,
+    integers=False,
+    strict=False,
+    repair=False,
+    workers=None,
+):
+    """
+    Reads an .ev file and converts its columns and rows into an Evdf (extended pandas DataFrame) object.
+
+    The data body is parsed with numpy's C parser. If the body contains non-numeric fields,
+    the file is parsed field by field instead and those fields are kept as strings.
+
+    Files with header lines in the middle of the data (e.g. runs restarted into the same file)
+    are split into segments at each header line. Each segment is parsed with its own headers and
+    the segments are merged by column name, filling the columns missing from a segment with NaN.
+
+    If the file was written by evwriter with units=True, the physical quantities, units and
+    conversion values stored in its sidecar file (filename + '.units.json') are used instead
+    of the defaults.
+
+    Parameters
+    ----------
+    filename : str or file object
+        Path to the .ev file, or a text or binary file object. The file must remain unchanged from
+        the moment it was created by Phantom. gzip, bz2 and xz compressed files (e.g. energy.ev.gz),
+        detected by their magic bytes, are decompressed as they are parsed, without temporary files.
+
+    pheaders : bool, optional, default=True
+        If True, prints the column names after removing the brackets characteristic of the .ev file.
+
+    cache : bool or EvCache, optional, default=None
+        If True, or an EvCache instance, the parsed data is stored in (and later loaded from) a
+        binary cache. True uses an EvCache with the default directory and size limit.
+        Only fully numeric files given by path are cached.
+
+    usecols : list of str or int, optional, default=None
+        Columns to read, given as header names or 1-based column numbers as they appear in the
+        header. The fields of other columns are skipped without being converted, and only the
+        selected columns are allocated and tagged with physical quantities and units.
+        Default is all columns.
+
+    time_range : tuple of float, optional, default=None
+        Closed interval (t0, t1) of the first column (time) to read. The sparse time index of
+        the file (see EvTimeIndex) is used to parse only the rows around the interval, so the
+        time column must be non-decreasing. The index of the returned rows is their row number
+        in the file. Header lines in the middle of the data are not supported with time_range.
+        Compressed files and file objects have no time index, so all their rows are parsed
+        and then filtered. Default is all rows.
+
+    float32 : bool or list of str, optional, default=None
+        Columns to store as float32, given as column names and/or physical quantities.
+        See Evdf.compact_dtypes.
+
+    integers : bool, optional, default=False
+        If True, integer-valued count and ID columns are stored as integers.
+        See Evdf.compact_dtypes.
+
+    strict : bool, optional, default=False
+        If True, raises a ValueError when the file has non-numeric fields, instead of
+        keeping them as strings in object columns.
+
+    repair : bool, optional, default=False
+        If True, fields written by Fortran that are not valid floats are repaired: exponents
+        without E (1.234567890-105) or with D (1.5D+03) are fixed and overflow markers (*****)
+        become NaN, so the columns stay float. Only the rows with such fields are processed
+        apart from the fast path. The number of repaired values per column is stored in
+        attrs['repaired_values'] and reported with a warning.
+
+    workers : int, optional, default=None
+        If greater than 1, the data body is split into byte ranges aligned to line boundaries
+        that are parsed by this number of processes, and the results are collected through
+        shared memory. The output is identical to a serial read. Files that are not a purely
+        numeric block, small files, compressed files, file objects and time_range reads are
+        parsed serially.
+
+    Returns
+    -------
+    evdf : Evdf
+        A DataFrame-like object containing the parsed data, with assigned physical quantities and units.
+    """
+
+    evdf = _evreader(filename, pheaders, cache, usecols, time_range, strict, repair, workers)
+    _apply_units_metadata(evdf, filename)
+    if float32 or integers:
+        evdf.compact_dtypes(float32=float32, integers=integers)
+    return evdf
+
+
+# Minimum size of the data body per worker for parallel parsing in evreader
+parallel_min_bytes = 2**20
+
+
+def _evreader(filename, pheaders, cache, usecols, time_range, strict, repair, workers):
+    """Reads an .ev file into an Evdf. See evreader."""
+    is_path = isinstance(filename, (str, os.PathLike))
+    # The time index and the parallel parser work on byte offsets of uncompressed files
+    plain_file = is_path and _compression_module(filename) is None
+    if not is_path:
+        cache = None
+    if cache is True:
+        cache = EvCache()
+    if cache:
+        # Computed once, before parsing, for both the lookup and the store
+        cache_key = cache.key(filename)
+        evdf = cache.load(filename, key=cache_key)
+        if evdf is not None:
+            if pheaders == True:
+                print(list(evdf.keys()))
+            if time_range is not None:
+                times = evdf.iloc[:, 0].to_numpy()
+                evdf = evdf[(times >= time_range[0]) & (times <= time_range[1])]
+            if usecols is not None:
+                headers = list(evdf.keys())
+                evdf = _select_columns(evdf, [headers[i] for i in _resolve_usecols(headers, usecols)])
+            return evdf
+
+    with _open_ev(filename) as f:
+        headers = _parse_headers(f.readline())
+        if pheaders == True:
+            print(headers)
+        col_indices = _resolve_usecols(headers, usecols)
+        parse_indices = col_indices
+        if time_range is not None and col_indices is not None and 0 not in col_indices:
+            parse_indices = [0] + col_indices
+        indexed = time_range is not None and plain_file
+        if indexed:
+            first_row, lines = EvTimeIndex.open(filename).read_lines(*time_range)
+        else:
+            # Input that cannot seek (e.g. a pipe) is buffered, so the fallbacks can read it again
+            body = None if f.seekable() else f.read()
+            body_start = f.tell() if body is None else None
+            lines = f if body is None else io.StringIO(body)
+        parsed_headers = headers if parse_indices is None else [headers[i] for i in parse_indices]
+        repaired_values = {}
+        data = None
+        if workers is not None and time_range is None and plain_file:
+            workers = min(workers, os.path.getsize(filename) // parallel_min_bytes)
+            if workers > 1:
+                try:
+                    data = _parse_body_parallel(filename, len(headers), parse_indices, workers)
+                except ValueError:
+                    data = None
+        try:
+            if data is None:
+                data = _parse_body(lines, len(headers), parse_indices)
+            columns = data.T
+        except ValueError as err:
+            if indexed:
+                text = "\n".join(lines)
+            elif body is not None:
+                text = body
+            else:
+                f.seek(body_start)
+                text = f.read()
+            if _has_header_lines(text):
+                data = None
+                names = None if parse_indices is None else parsed_headers
+                parsed_headers, columns, repaired_values, _ = _parse_segments(
+                    text, headers, names, repair, strict, filename
+                )
+            else:
+                data, columns, repaired_values = _parse_body_fallback(
+                    text, headers, parse_indices, repair, strict, filename, err
+                )
+
+    evdf = _build_evdf(parsed_headers, columns)
+    _report_repairs(evdf, repaired_values, filename)
+
+    if time_range is not None:
+        if indexed:
+            evdf.index = pd.RangeIndex(first_row, first_row + len(evdf))
+        times = pd.to_numeric(evdf.iloc[:, 0], errors="coerce").to_numpy()
+        evdf = evdf[(times >= time_range[0]) & (times <= time_range[1])]
+        if parse_indices != col_indices:
+            evdf = _select_columns(evdf, [headers[i] for i in col_indices])
+    elif (
+        cache
+        and data is not None
+        and not repaired_values
+        and col_indices is None
+        and len(set(headers)) == len(headers)
+    ):
+        cache.store(filename, headers, data, evdf.attrs, key=cache_key)
+    return evdf
+
+
+class EvTimeIndex:
+    """
+    Sparse time index of an .ev file, mapping every stride-th data row to its byte offset and time.
+
+    The index is built once with a vectorized scan of the newlines of the file, parsing only the
+    first field (time) of the indexed rows. It is saved next to the .ev file as a .tidx.npz
+    sidecar and rebuilt automatically when the file size or modification time changes. With it,
+    a time window can be located by binary search and only the rows around the window need to
+    be parsed. The time column must be non-decreasing.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .ev file.
+
+    rows, offsets, times : numpy.ndarray
+        Row numbers, byte offsets and times of the indexed rows.
+
+    stride : int
+        Number of data rows between consecutive indexed rows.
+
+    file_size, file_mtime_ns : int
+        Size and modification time of the .ev file when the index was built.
+    """
+
+    block_size = 2**24
+
+    def __init__(self, filename, rows, offsets, times, stride, file_size, file_mtime_ns):
+        self.filename = filename
+        self.rows = rows
+        self.offsets = offsets
+        self.times = times
+        self.stride = stride
+        self.file_size = file_size
+        self.file_mtime_ns = file_mtime_ns
+
+    @staticmethod
+    def sidecar_path(filename):
+        """Returns the path of the index sidecar of an .ev file."""
+        return os.fspath(filename) + ".tidx.npz"
+
+    @classmethod
+    def build(cls, filename, stride=10000):
+        """Builds the time index of an .ev file, indexing every stride-th data row."""
+        if stride < 1:
+            raise ValueError("stride must be a positive integer")
+        stat = os.stat(filename)
+        rows, offsets, times = [], [], []
+        with open(filename, "rb") as f:
+            offset = len(f.readline())
+            row = 0
+            leftover = b""
+            while True:
+                block = f.read(cls.block_size)
+                buf = leftover + block
+                if not block:
+                    if buf.strip() and not buf.startswith(b"#"):
+                        if row % stride == 0:
+                            rows.append(row)
+                            offsets.append(offset)
+                            times.append(float(buf.split()[0]))
+                        row += 1
+                    break
+                buf_bytes = np.frombuffer(buf, dtype=np.uint8)
+                ends = np.flatnonzero(buf_bytes == ord("\n"))
+                if len(ends) == 0:
+                    leftover = buf
+                    continue
+                starts = np.concatenate(([0], ends[:-1] + 1))
+                is_row = (ends > starts) & (buf_bytes[starts] != ord("#"))
+                starts, ends = starts[is_row], ends[is_row]
+                for k in np.flatnonzero((row + np.arange(len(starts))) % stride == 0):
+                    rows.append(row + k)
+                    offsets.append(offset + starts[k])
+                    times.append(float(buf[starts[k] : ends[k]].split()[0]))
+                row += len(starts)
+                cut = buf.rfind(b"\n") + 1
+                offset += cut
+                leftover = buf[cut:]
+
+        return cls(
+            filename,
+            np.array(rows, dtype=np.int64),
+            np.array(offsets, dtype=np.int64),
+            np.array(times, dtype=np.float64),
+            stride,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Loads the saved time index of an .ev file, or returns None if it is missing or out of date."""
+        try:
+            with np.load(cls.sidecar_path(filename)) as sidecar:
+                stride, file_size, file_mtime_ns = (int(v) for v in sidecar["meta"])
+                index = cls(
+                    filename, sidecar["rows"], sidecar["offsets"], sidecar["times"],
+                    stride, file_size, file_mtime_ns,
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+        stat = os.stat(filename)
+        if (stat.st_size, stat.st_mtime_ns) != (index.file_size, index.file_mtime_ns):
+            return None
+        return index
+
+    @classmethod
+    def open(cls, filename, stride=10000):
+        """
+        Returns the time index of an .ev file, loading the saved sidecar if it is up to date
+        or building and saving a new one otherwise.
+        """
+        index = cls.load(filename)
+        if index is None or index.stride != stride:
+            index = cls.build(filename, stride=stride)
+            try:
+                index.save()
+            except OSError:
+                warnings.warn(f"Could not save the time index of '{filename}'.", stacklevel=2)
+        return index
+
+    def save(self):
+        """Saves the index next to the .ev file."""
+        path = self.sidecar_path(self.filename)
+        tmp_path = path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                rows=self.rows,
+                offsets=self.offsets,
+                times=self.times,
+                meta=np.array([self.stride, self.file_size, self.file_mtime_ns], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+    def byte_range(self, t0, t1):
+        """
+        Returns (first_row, start, end): the byte range [start, end) of the file that contains all
+        rows with t0 <= time <= t1, and the row number of its first row. end is None for the end
+        of the file.
+        """
+        if len(self.times) == 0:
+            return 0, 0, 0
+        i = max(np.searchsorted(self.times, t0, side="left") - 1, 0)
+        j = np.searchsorted(self.times, t1, side="right")
+        end = int(self.offsets[j]) if j < len(self.offsets) else None
+        return int(self.rows[i]), int(self.offsets[i]), end
+
+    def read_lines(self, t0, t1):
+        """Returns the row number of the first line and the lines of the byte range of the window [t0, t1]."""
+        first_row, start, end = self.byte_range(t0, t1)
+        if start == end:
+            return first_row, []
+        with open(self.filename, "rb") as f:
+            f.seek(start)
+            block = f.read() if end is None else f.read(end - start)
+        return first_row, block.decode().split("\n")
+
+
+def iter_evreader(
+    filename, chunksize=100000, pheaders=True, usecols=None, strict=False, repair=False
+):
+    """
+    Reads an .ev file in consecutive blocks of rows, yielding one Evdf per block.
+
+    Only one block of lines is held in memory at a time, so reductions over large .ev files
+    can be done without building the full Evdf. Each block has the same headers and default
+    physical quantities and units as evreader, and its index continues from the previous block,
+    so ``pd.concat(iter_evreader(filename))`` gives the same rows as ``evreader(filename)``.
+    If a header line appears in the middle of the data, the blocks from that point on use its
+    columns.
+
+    Parameters
+    ----------
+    filename : str or file object
+        Path to the .ev file, or a file object. Compressed files are decompressed as the blocks
+        are read (see evreader).
+
+    chunksize : int, optional, default=100000
+        Maximum number of lines parsed per block.
+
+    pheaders : bool, optional, default=True
+        If True, prints the column names once, before the first block is read.
+
+    usecols : list of str or int, optional, default=None
+        Columns to read, given as header names or 1-based column numbers. See evreader.
+
+    strict : bool, optional, default=False
+        If True, raises a ValueError when a block has non-numeric fields, instead of
+        keeping them as strings in object columns.
+
+    repair : bool, optional, default=False
+        If True, Fortran-formatted fields are repaired in each block. See evreader.
+
+    Yields
+    ------
+    evdf : Evdf
+        A block of at most chunksize rows of the .ev file.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be a positive integer")
+
+    with _open_ev(filename) as f:
+        headers = _parse_headers(f.readline())
+        if pheaders == True:
+            print(headers)
+        yield from _iter_ev_blocks(f, headers, filename, chunksize, usecols, strict, repair)
+
+
+def _iter_ev_blocks(f, headers, filename, chunksize, usecols, strict, repair):
+    """Yields the Evdf blocks of iter_evreader from an open .ev file, after its header line."""
+    col_indices = _resolve_usecols(headers, usecols)
+    names = None if col_indices is None else [headers[i] for i in col_indices]
+    selected_headers = headers if col_indices is None else names
+    start = 0
+    while True:
+        lines = list(itertools.islice(f, chunksize))
+        if not lines:
+            break
+        repaired_values = {}
+        chunk_headers = selected_headers
+        try:
+            columns = _parse_body(lines, len(headers), col_indices).T
+        except ValueError as err:
+            text = "".join(lines)
+            if _has_header_lines(text):
+                # Later blocks follow the column layout of the last header line
+                chunk_headers, columns, repaired_values, headers = _parse_segments(
+                    text, headers, names, repair, strict, filename
+                )
+                if names is not None:
+                    col_indices = [i for i, h in enumerate(headers) if h in names] or [0]
+                selected_headers = headers
+                if col_indices is not None:
+                    selected_headers = [headers[i] for i in col_indices]
+            else:
+                _, columns, repaired_values = _parse_body_fallback(
+                    text, headers, col_indices, repair, strict, filename, err
+                )
+        evdf = _build_evdf(chunk_headers, columns)
+        _apply_units_metadata(evdf, filename)
+        _report_repairs(evdf, repaired_values, filename)
+        if len(evdf) == 0:
+            continue
+        evdf.index = pd.RangeIndex(start, start + len(evdf))
+        start += len(evdf)
+        yield evdf
+
+
+class EvDiagnostics:
+    """
+    Single-pass reductions of the columns of an .ev file, updated block by block.
+
+    For each column, the accumulator keeps the number of values, the running mean and variance
+    (merged per block with the pairwise update of Chan et al., which is numerically stable), the
+    minimum and maximum and their times, the first and last values, the maximum deviation from
+    the first value and, for the columns with a threshold, the first time the threshold is
+    crossed. NaN values are ignored. The memory used does not depend on the number of rows.
+
+    Parameters
+    ----------
+    thresholds : dict, optional
+        Thresholds {column_key: value} whose first crossing is recorded. A threshold is crossed
+        upwards if the first value of the column is below it, and downwards otherwise.
+
+    time_column : str, optional, default='time'
+        Column with the time of each row. If a block has no such column, row numbers are used.
+
+    Examples
+    --------
+    >>> diagnostics = EvDiagnostics(thresholds={"unbound mass": 1e-3})
+    >>> for evdf in iter_evreader("energy.ev", pheaders=False):
+    ...     diagnostics.update(evdf)
+    >>> diagnostics.result().loc["total energy", "drift"]
+    """
+
+    statistics = [
+        "phys_quantity", "units", "count", "first", "last", "min", "time_min", "max",
+        "time_max", "mean", "std", "drift", "max_drift", "threshold", "crossing_time",
+        "crossing_row",
+    ]
+
+    def __init__(self, thresholds=None, time_column="time"):
+        self.thresholds = dict(thresholds or {})
+        self.time_column = time_column
+        self.rows = 0
+        self._state = {}
+        self._attrs = {}
+
+    def update(self, evdf):
+        """Adds the rows of a block (an Evdf, e.g. from iter_evreader) to the statistics."""
+        nrows = len(evdf)
+        if self.time_column in evdf.keys():
+            times = evdf[self.time_column].to_numpy(np.float64)
+        else:
+            times = np.arange(self.rows, self.rows + nrows, dtype=np.float64)
+        for attr in ("phys_quantity", "units", "conv_value"):
+            for column_key, value in evdf.attrs.get(attr, {}).items():
+                self._attrs.setdefault(attr, {}).setdefault(column_key, value)
+
+        for column_key in evdf.keys():
+            values = evdf[column_key]
+            if not pd.api.types.is_numeric_dtype(values.dtype):
+                continue
+            values = values.to_numpy(np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            state = self._state.setdefault(column_key, {"count": 0})
+            if len(valid) == 0:
+                continue
+            block, block_times = values[valid], times[valid]
+
+            count = len(block)
+            mean = block.mean()
+            m2 = ((block - mean) ** 2).sum()
+            if state["count"] == 0:
+                state.update(
+                    count=count, mean=mean, m2=m2,
+                    first=block[0], time_first=block_times[0], max_deviation=0.0,
+                    min=np.inf, max=-np.inf, time_min=np.nan, time_max=np.nan,
+                )
+            else:
+                total = state["count"] + count
+                delta = mean - state["mean"]
+                state["mean"] += delta * count / total
+                state["m2"] += m2 + delta**2 * state["count"] * count / total
+                state["count"] = total
+            state["last"] = block[-1]
+            imin, imax = block.argmin(), block.argmax()
+            if block[imin] < state["min"]:
+                state["min"], state["time_min"] = block[imin], block_times[imin]
+            if block[imax] > state["max"]:
+                state["max"], state["time_max"] = block[imax], block_times[imax]
+            state["max_deviation"] = max(
+                state["max_deviation"], np.abs(block - state["first"]).max()
+            )
+
+            threshold = self.thresholds.get(column_key)
+            if threshold is not None and "crossing_row" not in state:
+                if state["first"] < threshold:
+                    crossed = block >= threshold
+                else:
+                    crossed = block <= threshold
+                if crossed.any():
+                    i = crossed.argmax()
+                    state["crossing_time"] = block_times[i]
+                    state["crossing_row"] = self.rows + valid[i]
+        self.rows += nrows
+
+    def result(self, units=None):
+        """
+        Returns the statistics as a DataFrame with one row per column and the columns listed in
+        EvDiagnostics.statistics. drift is the relative change (last - first) / |first| and
+        max_drift the maximum of |value - first| / |first|. Times are those of time_column.
+
+        Parameters
+        ----------
+        units : string or dict, optional
+            Unit system or {column_key: new_units} mapping the statistics are converted to, as
+            in Evdf.convert_unit_system. Times are converted with the units of time_column.
+            Default is the units of the data.
+        """
+        names = list(self._state)
+        factors = {column_key: 1.0 for column_key in names}
+        attrs = {attr: dict(self._attrs.get(attr, {})) for attr in ("phys_quantity", "units", "conv_value")}
+        if units is not None:
+            factors, attrs = self._unit_factors(names, units)
+        time_factor = factors.get(self.time_column, 1.0)
+
+        rows = []
+        for column_key in names:
+            state = self._state[column_key]
+            factor = factors[column_key]
+            row = dict.fromkeys(self.statistics, np.nan)
+            row["phys_quantity"] = attrs["phys_quantity"].get(column_key)
+            row["units"] = attrs["units"].get(column_key)
+            row["count"] = state["count"]
+            row["threshold"] = self.thresholds.get(column_key, np.nan) * factor
+            if state["count"]:
+                for stat in ("first", "last", "min", "max", "mean"):
+                    row[stat] = state[stat] * factor
+                row["std"] = np.sqrt(state["m2"] / state["count"]) * factor
+                for stat in ("time_min", "time_max"):
+                    row[stat] = state[stat] * time_factor
+                if state["first"] != 0:
+                    row["drift"] = (state["last"] - state["first"]) / abs(state["first"])
+                    row["max_drift"] = state["max_deviation"] / abs(state["first"])
+                if "crossing_row" in state:
+                    row["crossing_time"] = state["crossing_time"] * time_factor
+                    row["crossing_row"] = state["crossing_row"]
+            rows.append(row)
+        return pd.DataFrame(rows, index=pd.Index(names), columns=self.statistics)
+
+    def _unit_factors(self, names, units):
+        """Returns the conversion factors and the attributes of the columns in the given units."""
+        evdf = Evdf(columns=names)
+        for attr in ("phys_quantity", "units", "conv_value"):
+            evdf.attrs[attr] = phev.units.FrozenDict(self._attrs.get(attr, {}))
+        evdf.convert_unit_system(units)
+        factors = {
+            column_key: evdf.column_conversion_rate(column_key)
+            / self._attrs.get("conv_value", {}).get(column_key, 1)
+            for column_key in names
+        }
+        return factors, {attr: dict(evdf.attrs[attr]) for attr in ("phys_quantity", "units", "conv_value")}
+
+
+def evdiagnostics(
+    filename, columns=None, thresholds=None, units=None, chunksize=100000, time_column="time", repair=False
+):
+    """
+    Computes the diagnostics of EvDiagnostics (min, max, mean, drift, first crossings, ...) of the
+    columns of an .ev file in a single sequential pass, without building the full Evdf.
+
+    Parameters
+    ----------
+    filename : str or file object
+        Path to the .ev file (which may be compressed, see evreader), or a file object.
+
+    columns : list of str, optional, default=None
+        Columns to reduce. Only these columns (and time_column) are parsed, and those missing
+        from the file are skipped, so the same list can be used for different kinds of files.
+        Default is all columns.
+
+    thresholds : dict, optional, default=None
+        Thresholds {column_key: value}, in the units of the file, whose first crossing is
+        recorded. See EvDiagnostics.
+
+    units : string or dict, optional, default=None
+        Units of the result, as in Evdf.convert_unit_system. Default is the units of the file.
+
+    chunksize : int, optional, default=100000
+        Number of lines parsed per block. See iter_evreader.
+
+    time_column : str, optional, default='time'
+        Column with the time of each row.
+
+    repair : bool, optional, default=False
+        If True, Fortran-formatted fields are repaired. See evreader.
+
+    Returns
+    -------
+    diagnostics : pandas.DataFrame
+        Statistics with one row per column. See EvDiagnostics.result.
+
+    Examples
+    --------
+    >>> diagnostics = evdiagnostics("energy.ev", columns=["total energy", "tot ang mom"])
+    >>> diagnostics[["drift", "max_drift"]]
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be a positive integer")
+
+    diagnostics = EvDiagnostics(thresholds=thresholds, time_column=time_column)
+    with _open_ev(filename) as f:
+        headers = _parse_headers(f.readline())
+        usecols = None
+        if columns is not None:
+            usecols = [c for c in columns if c in headers and c != time_column]
+            if time_column in headers:
+                usecols.insert(0, time_column)
+        for evdf in _iter_ev_blocks(f, headers, filename, chunksize, usecols, False, repair):
+            diagnostics.update(evdf)
+    return diagnostics.result(units=units)
+
+
+def evscreen(filenames, max_workers=None, **kwargs):
+    """
+    Computes the diagnostics of evdiagnostics for an ensemble of .ev files, one file per worker
+    process. Each file is read once, sequentially, in blocks.
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        Glob pattern (e.g. 'runs/*/energy.ev') or list of paths.
+
+    max_workers : int, optional, default=None
+        Number of worker processes. Default is the number of processors. If 1, files are read
+        serially in the current process.
+
+    **kwargs
+        Keyword arguments of evdiagnostics (columns, thresholds, units, ...).
+
+    Returns
+    -------
+    diagnostics : pandas.DataFrame
+        Statistics of all files, indexed by (file, column).
+    """
+    if isinstance(filenames, (str, os.PathLike)):
+        filenames = sorted(glob.glob(os.fspath(filenames)))
+    filenames = [os.fspath(f) for f in filenames]
+    if not filenames:
+        raise FileNotFoundError("No .ev files to screen")
+    reader = functools.partial(evdiagnostics, **kwargs)
+    results = _read_evfiles(filenames, max_workers=max_workers, reader=reader)
+    return pd.concat(results, keys=filenames, names=["file", "column"])
+
+
+def _file_digest(filename, block_size=2**20):
+    """Returns the blake2b hash of the content of a file."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _code_digest(code, digest):
+    """Adds the bytecode, constants and names of a code object and its nested code objects to a hash."""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _code_digest(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+
+def _reduction_identity(reduction):
+    """
+    Returns a string that identifies a reduction function: its qualified name and a hash of its
+    code, so that editing the function changes its identity. Arguments bound with
+    functools.partial are included.
+    """
+    if isinstance(reduction, functools.partial):
+        bound = json.dumps([reduction.args, reduction.keywords], sort_keys=True, default=repr)
+        return f"{_reduction_identity(reduction.func)}|{bound}"
+    name = f"{getattr(reduction, '__module__', '')}.{getattr(reduction, '__qualname__', repr(reduction))}"
+    code = getattr(reduction, "__code__", None)
+    if code is None:
+        return name
+    digest = hashlib.blake2b(digest_size=20)
+    _code_digest(code, digest)
+    return f"{name}|{digest.hexdigest()}"
+
+
+def _reduction_row(result, name):
+    """Converts the result of a reduction (a scalar, a dict or a pandas.Series) into a row dict."""
+    if isinstance(result, pd.Series):
+        result = result.to_dict()
+    elif not isinstance(result, dict):
+        result = {name: result}
+    return {str(k): v.item() if isinstance(v, np.generic) else v for k, v in result.items()}
+
+
+def _apply_reduction(filename, reduction, params, reader_kwargs):
+    """Reads an .ev file and returns the row of the reduction of its Evdf."""
+    evdf = evreader(filename, pheaders=False, **reader_kwargs)
+    name = getattr(getattr(reduction, "func", reduction), "__name__", "result")
+    return _reduction_row(reduction(evdf, **params), name)
+
+
+def evensemble(filenames, reduction, params=None, run=None, max_workers=None, cache=None, **reader_kwargs):
+    """
+    Applies a reduction function to the Evdfs of many .ev files (e.g. the same file kind of all the
+    runs of a parameter sweep) in a process pool, and returns one row per file.
+
+    The rows are memoized on disk, keyed by the hash of the content of the file, the identity of
+    the reduction (its name and code) and the parameters, so calling it again only reads and
+    reduces the files that are new or have changed (or all of them if the reduction changed).
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        Glob pattern (e.g. 'sweep/*/separation_vs_time.ev') or list of paths.
+
+    reduction : callable
+        Function reduction(evdf, **params) returning a scalar, a dict or a pandas.Series of
+        scalars. It must be defined at module level (or be a functools.partial of such a
+        function) to be sent to the worker processes.
+
+    params : dict, optional, default=None
+        Keyword arguments of the reduction.
+
+    run : callable, optional, default=None
+        Function returning the run of a file from its path. Default is the name of the
+        directory that contains the file.
+
+    max_workers : int, optional, default=None
+        Number of worker processes. Default is the number of processors. If 1, files are read
+        serially in the current process.
+
+    cache : str or bool, optional, default=None
+        Directory of the memoized rows, or False to disable memoization. Default is the
+        'ensemble' subdirectory of the EvCache default directory.
+
+    **reader_kwargs
+        Keyword arguments of evreader (e.g. usecols), which are also part of the memo key.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        Rows of the reduction indexed by run, with the path of each file in the 'file' column.
+        A scalar result is stored in a column named after the reduction.
+
+    Examples
+    --------
+    >>> def final_separation(evdf, column="sep. 1"):
+    ...     return evdf[column].iloc[-1]
+    >>> table = evensemble("sweep/*/separation_vs_time.ev", final_separation)
+    """
+    if isinstance(filenames, (str, os.PathLike)):
+        filenames = sorted(glob.glob(os.fspath(filenames)))
+    filenames = [os.fspath(f) for f in filenames]
+    if not filenames:
+        raise FileNotFoundError("No .ev files to reduce")
+    params = dict(params or {})
+    if run is None:
+        run = lambda filename: os.path.basename(os.path.dirname(os.path.abspath(filename)))
+    if cache is None or cache is True:
+        cache = os.path.join(EvCache().cache_dir, "ensemble")
+    if cache:
+        os.makedirs(cache, exist_ok=True)
+
+    identity = json.dumps(
+        [_reduction_identity(reduction), params, reader_kwargs], sort_keys=True, default=repr
+    )
+    memo_paths, rows, missing = {}, {}, []
+    for filename in filenames:
+        if cache:
+            key = hashlib.blake2b(f"{_file_digest(filename)}|{identity}".encode(), digest_size=20)
+            memo_paths[filename] = os.path.join(cache, key.hexdigest() + ".json")
+            try:
+                with open(memo_paths[filename], "r") as f:
+                    rows[filename] = json.load(f)
+                continue
+            except (OSError, ValueError):
+                pass
+        missing.append(filename)
+
+    reader = functools.partial(
+        _apply_reduction, reduction=reduction, params=params, reader_kwargs=reader_kwargs
+    )
+    for filename, row in zip(missing, _read_evfiles(missing, max_workers=max_workers, reader=reader)):
+        rows[filename] = row
+        if cache:
+            tmp_path = memo_paths[filename] + f".{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(row, f)
+            os.replace(tmp_path, memo_paths[filename])
+
+    return pd.DataFrame(
+        [{"file": filename, **rows[filename]} for filename in filenames],
+        index=pd.Index([run(filename) for filename in filenames], name="run"),
+    )
+
+
+def _read_file_bytes(filename):
+    """Returns the content of a file. Used by aevreader in its I/O threads."""
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def _parse_ev_text(text, filename, usecols=None, strict=False, repair=False):
+    """Parses the text of a whole .ev file into an Evdf, as evreader does for a file."""
+    header_line, _, body = text.partition("\n")
+    headers = _parse_headers(header_line)
+    col_indices = _resolve_usecols(headers, usecols)
+    names = None if col_indices is None else [headers[i] for i in col_indices]
+    parsed_headers = headers if names is None else names
+    repaired_values = {}
+    try:
+        columns = _parse_body(io.StringIO(body), len(headers), col_indices).T
+    except ValueError as err:
+        if _has_header_lines(body):
+            parsed_headers, columns, repaired_values, _ = _parse_segments(
+                body, headers, names, repair, strict, filename
+            )
+        else:
+            _, columns, repaired_values = _parse_body_fallback(
+                body, headers, col_indices, repair, strict, filename, err
+            )
+    evdf = _build_evdf(parsed_headers, columns)
+    _report_repairs(evdf, repaired_values, filename)
+    return evdf
+
+
+def _parse_ev_bytes(data, filename, usecols=None, strict=False, repair=False, float32=None, integers=False):
+    """Parses the bytes of an .ev file into an Evdf. Used by aevreader in its worker processes."""
+    module = _compression_module(data[:6])
+    if module is not None:
+        data = module.decompress(data)
+    evdf = _parse_ev_text(data.decode(), filename, usecols=usecols, strict=strict, repair=repair)
+    if float32 or integers:
+        evdf.compact_dtypes(float32=float32, integers=integers)
+    return evdf
+
+
+class _AsyncEvReads:
+    """
+    Reads of aevreader in progress. Awaiting it returns the list of Evdfs in the order of the
+    paths; iterating over it with async for yields (path, Evdf) pairs as the files are parsed.
+    """
+
+    def __init__(self, paths, concurrency, max_workers, kwargs):
+        self.paths = [os.fspath(path) for path in paths]
+        self.concurrency = concurrency
+        self.max_workers = max_workers
+        self.kwargs = kwargs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    def __await__(self):
+        return self._gather().__await__()
+
+    async def _gather(self):
+        evdfs = [None] * len(self.paths)
+        async for i, evdf in self._iterate(with_index=True):
+            evdfs[i] = evdf
+        return evdfs
+
+    async def _iterate(self, with_index=False):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        parse = functools.partial(_parse_ev_bytes, **self.kwargs)
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as io_pool:
+            if self.max_workers == 1:
+                parse_pool = contextlib.nullcontext(io_pool)
+            else:
+                parse_pool = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            with parse_pool as parse_pool:
+
+                async def load(i, path):
+                    # The semaphore bounds the files being read or parsed, and so the memory used
+                    async with semaphore:
+                        data = await loop.run_in_executor(io_pool, _read_file_bytes, path)
+                        evdf = await loop.run_in_executor(parse_pool, parse, data, path)
+                        await loop.run_in_executor(io_pool, _apply_units_metadata, evdf, path)
+                    return i, evdf
+
+                tasks = [asyncio.ensure_future(load(i, path)) for i, path in enumerate(self.paths)]
+                try:
+                    for task in asyncio.as_completed(tasks):
+                        i, evdf = await task
+                        yield (i, evdf) if with_index else (self.paths[i], evdf)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+
+
+def aevreader(
+    paths,
+    concurrency=32,
+    max_workers=None,
+    usecols=None,
+    strict=False,
+    repair=False,
+    float32=None,
+    integers=False,
+):
+    """
+    Reads many .ev files with asyncio, overlapping the reads of up to concurrency files.
+
+    Each file is read whole in a thread, so the open and read latency of slow or remote file
+    systems is overlapped between files, and its bytes are parsed in a pool of worker processes.
+    The returned object can be awaited to get all the Evdfs, or iterated with async for to get
+    each Evdf as soon as it is parsed.
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Glob pattern (e.g. 'run/mtSink*.ev') or list of paths.
+
+    concurrency : int, optional, default=32
+        Maximum number of files being read or parsed at the same time.
+
+    max_workers : int, optional, default=None
+        Number of worker processes that parse the files. Default is the number of processors.
+        If 1, files are parsed in the I/O threads of the current process.
+
+    usecols, strict, repair, float32, integers : optional
+        Options of evreader.
+
+    Returns
+    -------
+    reads : awaitable and asynchronous iterable
+        ``await aevreader(paths)`` returns the list of Evdfs in the order of the paths, and
+        ``async for path, evdf in aevreader(paths)`` yields each path and Evdf as it finishes.
+
+    Examples
+    --------
+    >>> evdfs = await aevreader("run/mtSink*.ev", concurrency=64)
+    >>> async for path, evdf in aevreader(paths):
+    ...     print(path, evdf["time"].iloc[-1])
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be a positive integer")
+    if isinstance(paths, (str, os.PathLike)):
+        paths = sorted(glob.glob(os.fspath(paths)))
+    kwargs = dict(usecols=usecols, strict=strict, repair=repair, float32=float32, integers=integers)
+    return _AsyncEvReads(paths, concurrency, max_workers, kwargs)
+
+
+# Suffix of the sidecar file with the unit metadata written by evwriter
+units_metadata_suffix = ".units.json"
+
+
+def _apply_units_metadata(evdf, filename):
+    """Sets the physical quantities, units and conversion values stored by evwriter next to an .ev file, if any."""
+    if not isinstance(filename, (str, os.PathLike)):
+        return evdf
+    path = os.fspath(filename) + units_metadata_suffix
+    if not os.path.exists(path):
+        return evdf
+    with open(path, "r") as f:
+        metadata = json.load(f)
+    for attr in ("phys_quantity", "units", "conv_value"):
+        mapping = metadata.get(attr, {})
+        evdf._update_attr(attr, {k: v for k, v in mapping.items() if k in evdf.keys()})
+    return evdf
+
+
+# Exact powers of ten (up to 1e22) and the larger ones, indexed by exponent
+_POWERS_OF_TEN = 10.0 ** np.arange(120)
+
+
+def _e_digits(x, ndigits):
+    """
+    Returns the decimal mantissa (as an integer of ndigits digits) and exponent of the absolute
+    values of x rounded to ndigits significant digits, and a mask of the values that must be
+    formatted by Python: non-finite values, exponents of three digits and values too close to a
+    rounding tie for the float arithmetic to decide.
+    """
+    absx = np.abs(x)
+    slow = ~np.isfinite(x)
+    nonzero = (absx > 0) & ~slow
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exp = np.floor(np.log10(np.where(nonzero, absx, 1.0))).astype(np.int64)
+    slow |= np.abs(exp) >= 99
+    nonzero &= ~slow
+    exp[~nonzero] = 0
+
+    def scale(exp):
+        shift = ndigits - 1 - exp
+        # Both branches are computed for all values, including the slow ones (huge or non-finite)
+        with np.errstate(over="ignore", invalid="ignore"):
+            return np.where(
+                shift >= 0,
+                absx * _POWERS_OF_TEN[np.maximum(shift, 0)],
+                absx / _POWERS_OF_TEN[np.maximum(-shift, 0)],
+            )
+
+    scaled = np.where(nonzero, scale(exp), 0.0)
+    # log10 may be off by one next to powers of ten
+    low = nonzero & (scaled < _POWERS_OF_TEN[ndigits - 1])
+    high = nonzero & (scaled >= _POWERS_OF_TEN[ndigits])
+    exp[low] -= 1
+    exp[high] += 1
+    off = low | high
+    if off.any():
+        scaled[off] = scale(exp)[off]
+    slow |= np.abs(scaled - np.floor(scaled) - 0.5) < 1e-3
+    mant = np.rint(scaled).astype(np.int64)
+    carry = mant >= 10**ndigits
+    mant[carry] //= 10
+    exp[carry] += 1
+    slow |= np.abs(exp) >= 100
+    return mant, exp, slow
+
+
+def _format_e_block(data, precision, exact=False):
+    """
+    Formats the rows of a 2-D float array as lines of fixed-width E-format fields, the same as
+    '%{precision + 9}.{precision}E' per field. The digits of all fields are computed with numpy
+    for precision up to 12; larger precisions are formatted by Python.
+
+    If exact is True, returns None instead if some value would not be read back exactly.
+    """
+    nrows, ncols = data.shape
+    width = precision + 9
+    fmt = f"%{width}.{precision}E"
+    x = np.asarray(data, dtype=np.float64).ravel()
+    if precision > 12:
+        if exact and not all(float(fmt % v) == v for v in x[np.isfinite(x)].tolist()):
+            return None
+        row_fmt = fmt * ncols + "\n"
+        return ((row_fmt * nrows) % tuple(x.tolist())).encode()
+
+    mant, exp, slow = _e_digits(x, precision + 1)
+    if exact:
+        shift = exp - precision
+        # Products and quotients by exact powers of ten are rounded as strtod does
+        checked = ~slow & (np.abs(shift) <= 22)
+        values = np.where(
+            shift >= 0,
+            mant * _POWERS_OF_TEN[np.clip(shift, 0, 22)],
+            mant / _POWERS_OF_TEN[np.clip(-shift, 0, 22)],
+        )
+        if not (values[checked] == np.abs(x[checked])).all():
+            return None
+        unchecked = x[~checked & np.isfinite(x)].tolist()
+        if not all(float(fmt % v) == v for v in unchecked):
+            return None
+
+    # Fields are built transposed, one character position per row
+    fields = np.empty((width, x.size), dtype=np.uint8)
+    first = width - precision - 6
+    fields[: first - 1] = ord(" ")
+    fields[first - 1] = np.where(np.signbit(x), ord("-"), ord(" "))
+    pos = width - 5
+    while pos > first + 1:
+        ngroup = min(6, pos - first - 1)
+        group = (mant % 10**ngroup).astype(np.int32)
+        mant //= 10**ngroup
+        for _ in range(ngroup):
+            group, fields[pos] = np.divmod(group, 10)
+            pos -= 1
+    fields[first] = mant
+    fields[first : width - 4] += ord("0")
+    fields[first + 1] = ord(".")
+    fields[width - 4] = ord("E")
+    fields[width - 3] = np.where(exp < 0, ord("-"), ord("+"))
+    tens, ones = np.divmod(np.abs(exp).astype(np.int32), 10)
+    fields[width - 2] = tens + ord("0")
+    fields[width - 1] = ones + ord("0")
+    slow = np.flatnonzero(slow)
+    if len(slow):
+        text = "".join([fmt % v for v in x[slow].tolist()]).encode()
+        fields[:, slow] = np.frombuffer(text, dtype=np.uint8).reshape(len(slow), width).T
+
+    lines = np.empty((nrows, ncols * width + 1), dtype=np.uint8)
+    lines[:, :-1] = fields.T.reshape(nrows, ncols * width)
+    lines[:, -1] = ord("\n")
+    return lines.tobytes()
+
+
+def _format_ev_header(headers, width):
+    """Returns the header line of an .ev file with columns of the given width, as written by Phantom."""
+    fields = "".join(("[%2d%13s]" % (i, h)).rjust(width) for i, h in enumerate(headers, 1))
+    return "#" + fields[1:] + "\n"
+
+
+def evwriter(evdf, filename, precision=None, chunksize=100000, units=False):
+    """
+    Writes an Evdf to an .ev file, with the header and the fixed-width E-format columns of Phantom.
+
+    The fields of each block of rows are formatted at once with numpy and the blocks are
+    written as they are formatted, so files of millions of rows are written about as fast as
+    they are read. The file is read back by evreader with the same columns and values.
+
+    Parameters
+    ----------
+    evdf : Evdf or pandas.DataFrame
+        Data to write. All columns must be numeric; integer and float32 columns are written as
+        float64 values. Pending lazy unit conversions are applied before writing.
+
+    filename : str
+        Path to the .ev file to write. An existing file is overwritten.
+
+    precision : int, optional, default=None
+        Number of digits after the decimal point. Fields are precision + 9 characters wide.
+        11 gives the layout of the .ev files of Phantom. Default is 11 if all the values are
+        read back exactly with 11, as for data read from .ev files, and 16 otherwise (e.g.
+        after unit conversions), so that evreader(evwriter(evdf, filename)) always returns
+        the same values. Precisions above 12 are formatted by Python and are slower.
+
+    chunksize : int, optional, default=100000
+        Number of rows formatted and written at a time.
+
+    units : bool, optional, default=False
+        If True, the physical quantities, units and conversion values of the columns are
+        written to a JSON sidecar file (filename + '.units.json'). evreader and iter_evreader
+        set them on the Evdf when the sidecar file is present.
+
+    Returns
+    -------
+    filename : str
+        Path to the written .ev file.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be a positive integer")
+    if isinstance(evdf, Evdf) and evdf.lazy_units:
+        evdf = evdf.materialize_units()
+    headers = [str(h) for h in evdf.keys()]
+    non_numeric = [
+        h for h, dtype in zip(headers, evdf.dtypes)
+        if not (pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_complex_dtype(dtype))
+    ]
+    if non_numeric:
+        raise ValueError(f"Columns {non_numeric} are not numeric and cannot be written to an .ev file")
+
+    # Without a precision, 11 is tried first and the file is rewritten with 16 if needed
+    attempts = [(11, True), (16, False)] if precision is None else [(precision, False)]
+    with open(filename, "wb") as f:
+        for precision, exact in attempts:
+            f.seek(0)
+            f.truncate()
+            f.write(_format_ev_header(headers, precision + 9).encode())
+            for start in range(0, len(evdf), chunksize):
+                data = evdf.iloc[start : start + chunksize].to_numpy(np.float64)
+                block = _format_e_block(data, precision, exact)
+                if block is None:
+                    break
+                f.write(block)
+            else:
+                break
+
+    if units:
+        metadata = {}
+        for attr in ("phys_quantity", "units", "conv_value"):
+            mapping = evdf.attrs.get(attr, {})
+            metadata[attr] = {h: mapping[h] for h in headers if h in mapping}
+        with open(os.fspath(filename) + units_metadata_suffix, "w") as f:
+            json.dump(metadata, f, indent=1, default=float)
+    return filename
+
+
+def _read_evfiles(filenames, max_workers=None, reader=None):
+    """Reads several .ev files with reader (evreader by default) in a process pool, keeping their order."""
+    if reader is None:
+        reader = functools.partial(evreader, pheaders=False)
+    if max_workers == 1 or len(filenames) < 2:
+        return [reader(filename) for filename in filenames]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(reader, filenames))
+
+
+def _merged_metadata(evdfs):
+    """
+    Returns the physical quantities, units and conversion values of the columns of several Evdfs,
+    checking that each column has the same metadata in all of them.
+    """
+    metadata = {}
+    for attr in ("phys_quantity", "units", "conv_value"):
+        merged = {}
+        for evdf in evdfs:
+            for column_key, value in evdf.attrs.get(attr, {}).items():
+                if merged.setdefault(column_key, value) != value:
+                    raise ValueError(
+                        f"Column '{column_key}' has different {attr} in the Evdfs: "
+                        f"{merged[column_key]!r} and {value!r}"
+                    )
+        metadata[attr] = merged
+    return metadata
+
+
+def _set_metadata(evdf, metadata):
+    """Sets the metadata of _merged_metadata on an Evdf, for its columns and index levels."""
+    names = set(evdf.keys()) | set(evdf.index.names)
+    for attr, mapping in metadata.items():
+        evdf._update_attr(attr, {k: v for k, v in mapping.items() if k in names})
+
+
+def _stitch_evdfs(evdfs, time_column="time"):
+    """
+    Concatenates the Evdfs of consecutive restarts, keeping the rows of the later one where times
+    overlap. The metadata of the Evdfs (e.g. the units set by evwriter) is kept, and must agree.
+    """
+    evdfs = list(evdfs)
+    metadata = _merged_metadata(evdfs)
+    cutoff = np.inf
+    for i in reversed(range(len(evdfs))):
+        times = evdfs[i][time_column].to_numpy()
+        if cutoff < np.inf:
+            evdfs[i] = evdfs[i][times < cutoff]
+        if len(times):
+            cutoff = min(cutoff, times[0])
+
+    evdf = Evdf(pd.concat(evdfs, ignore_index=True))
+    evdf.assign_default_quants_units()
+    _set_metadata(evdf, metadata)
+    return evdf
+
+
+def evstitch(filenames, max_workers=None, time_column="time"):
+    """
+    Reads the sequence of .ev files written by a restarted Phantom run and stitches them into a
+    single Evdf.
+
+    The files are parsed in parallel in a process pool and concatenated in order. Where the time
+    ranges of consecutive files overlap, the rows of the later file are kept: the rows of each
+    file with time greater than or equal to the first time of any later file are dropped.
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        Glob pattern (e.g. 'run/name*.ev') or list of paths. Files matched by a glob pattern are
+        sorted by name; a list is used in the given order.
+
+    max_workers : int, optional, default=None
+        Number of worker processes. Default is the number of processors. If 1, files are read
+        serially in the current process.
+
+    time_column : str, optional, default='time'
+        Column used to detect overlaps between files.
+
+    Returns
+    -------
+    evdf : Evdf
+        Stitched data with a fresh RangeIndex, and the physical quantities and units of the
+        files (the defaults, or those stored by evwriter). Columns missing from some of the
+        files are filled with NaN.
+
+    Raises
+    ------
+    ValueError
+        If a column has different physical quantities or units in different files.
+    """
+    if isinstance(filenames, (str, os.PathLike)):
+        filenames = sorted(glob.glob(os.fspath(filenames)))
+    filenames = list(filenames)
+    if not filenames:
+        raise FileNotFoundError("No .ev files to stitch")
+
+    return _stitch_evdfs(_read_evfiles(filenames, max_workers=max_workers), time_column)
+
+
+def evalign(evdfs, grid=None, dt=None, columns=None, method="linear", time_column="time"):
+    """
+    Aligns several Evdfs written at different cadences onto a common time grid, in a single wide Evdf.
+
+    For each Evdf, the positions of the grid times in its time column are found once, and all
+    its selected columns are interpolated together as one 2-D block. Grid times outside the
+    time span of an Evdf give NaN in its columns (there is no extrapolation).
+
+    Parameters
+    ----------
+    evdfs : list of Evdf or dict of Evdf
+        Data to align, e.g. the energy, separation and sink Evdfs of a run. With a dictionary,
+        the keys are the labels of the Evdfs; with a list, the labels are their positions.
+        Rows are sorted by time if needed, and rows without time are ignored.
+
+    grid : array-like or label, optional, default=None
+        Times of the common grid, or the label of the Evdf whose time column is used as grid.
+        Default is the time column of the Evdf with the smallest median time step, restricted to
+        the time span covered by all the Evdfs.
+
+    dt : float, optional, default=None
+        If given (and grid is None), the grid is evenly spaced with this step, from the latest
+        start to the earliest end of the time spans of the Evdfs.
+
+    columns : list of str, optional, default=None
+        Columns to align. Each Evdf contributes the listed columns that it has. Default is all
+        numeric columns.
+
+    method : {'linear', 'asof'}, optional, default='linear'
+        'linear' interpolates linearly between the two samples around each grid time. 'asof'
+        takes the last sample at or before each grid time (nearest previous).
+
+    time_column : str, optional, default='time'
+        Time column of the Evdfs. All the Evdfs must have it, in the same units.
+
+    Returns
+    -------
+    evdf : Evdf
+        Evdf with the grid as time_column followed by the aligned columns, with the physical
+        quantities and units of the Evdfs they come from. Columns present in more than one Evdf
+        are named 'label/column'.
+    """
+    if method not in ("linear", "asof"):
+        raise ValueError(f"Invalid method '{method}'. Options are 'linear' and 'asof'")
+    if not isinstance(evdfs, dict):
+        evdfs = dict(enumerate(evdfs))
+    if not evdfs:
+        raise ValueError("No Evdfs to align")
+
+    times, blocks, names, sources = {}, {}, {}, {}
+    time_conv_values = set()
+    for label, evdf in evdfs.items():
+        if isinstance(evdf, Evdf) and evdf.lazy_units:
+            evdf = evdf.materialize_units()
+        if time_column not in evdf.keys():
+            raise KeyError(f"Column '{time_column}' not found in Evdf '{label}'")
+        if isinstance(evdf, Evdf) and "conv_value" in evdf.attrs:
+            time_conv_values.add(evdf.column_conversion_rate(time_column))
+        keys = [
+            k for k in evdf.keys()
+            if k != time_column
+            and (columns is None or k in columns)
+            and (columns is not None or pd.api.types.is_numeric_dtype(evdf[k].dtype))
+        ]
+        t = evdf[time_column].to_numpy(np.float64)
+        block = evdf[keys].to_numpy(np.float64).T if keys else np.empty((0, len(t)))
+        valid = ~np.isnan(t)
+        if not valid.all():
+            t, block = t[valid], block[:, valid]
+        if len(t) > 1 and not (np.diff(t) >= 0).all():
+            order = np.argsort(t, kind="stable")
+            t, block = t[order], block[:, order]
+        times[label], blocks[label], names[label], sources[label] = t, block, keys, evdf
+    if len(time_conv_values) > 1:
+        raise ValueError(f"The '{time_column}' columns of the Evdfs are in different units")
+    if columns is not None:
+        missing = [c for c in columns if c != time_column and not any(c in k for k in names.values())]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in any Evdf")
+
+    spans = [(t[0], t[-1]) for t in times.values() if len(t)]
+    start = max((s for s, _ in spans), default=np.nan)
+    end = min((e for _, e in spans), default=np.nan)
+    if grid is not None and np.ndim(grid) == 0:
+        if grid not in evdfs:
+            raise KeyError(f"Evdf '{grid}' not found")
+        grid_times = times[grid]
+    elif grid is not None:
+        grid_times = np.asarray(grid, dtype=np.float64)
+    elif dt is not None:
+        if dt <= 0:
+            raise ValueError("dt must be positive")
+        nsteps = np.floor((end - start) / dt + 1e-9) + 1 if end >= start else 0
+        grid_times = start + dt * np.arange(nsteps)
+    else:
+        steps = {
+            label: np.median(np.diff(np.unique(t))) for label, t in times.items() if len(np.unique(t)) > 1
+        }
+        finest = min(steps, key=steps.get) if steps else next(iter(times))
+        grid_times = times[finest]
+        grid_times = grid_times[(grid_times >= start) & (grid_times <= end)]
+
+    counts = collections.Counter(k for keys in names.values() for k in keys)
+    out_names = [time_column]
+    aligned = [grid_times[np.newaxis, :]]
+    metadata = {attr: {} for attr in ("phys_quantity", "units", "conv_value")}
+    for label, t in times.items():
+        keys, block = names[label], blocks[label]
+        if not keys:
+            continue
+        if len(t) == 0:
+            values = np.full((len(keys), len(grid_times)), np.nan)
+        elif method == "asof":
+            index = np.searchsorted(t, grid_times, side="right") - 1
+            values = block[:, np.maximum(index, 0)]
+            values[:, index < 0] = np.nan
+        else:
+            # Samples around each grid time (the same one if there is a single sample)
+            upper = np.searchsorted(t, grid_times, side="right").clip(1, max(len(t) - 1, 1))
+            upper = np.minimum(upper, len(t) - 1)
+            lower = np.maximum(upper - 1, 0)
+            step = t[upper] - t[lower]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weight = np.where(step > 0, (grid_times - t[lower]) / step, 0.0)
+            lower_values, upper_values = block[:, lower], block[:, upper]
+            values = lower_values * (1 - weight) + upper_values * weight
+            # Samples hit exactly are taken as they are, so a NaN neighbour (e.g. a column missing
+            # from a segment of the file) does not spread to them through NaN * 0
+            values = np.where(weight == 0, lower_values, np.where(weight == 1, upper_values, values))
+            values[:, (grid_times < t[0]) | (grid_times > t[-1])] = np.nan
+        aligned.append(values)
+
+        source = sources[label]
+        for k in keys:
+            name = k if counts[k] == 1 else f"{label}/{k}"
+            out_names.append(name)
+            for attr, mapping in metadata.items():
+                if attr in source.attrs and k in source.attrs[attr]:
+                    mapping[name] = source.attrs[attr][k]
+        for attr, mapping in metadata.items():
+            if attr in source.attrs and time_column in source.attrs[attr]:
+                mapping.setdefault(time_column, source.attrs[attr][time_column])
+
+    evdf = Evdf(np.concatenate(aligned).T, columns=out_names, copy=False)
+    evdf.assign_default_quants_units()
+    for attr, mapping in metadata.items():
+        evdf._update_attr(attr, mapping)
+    return evdf
+
+
+def sinkreader(directory, max_workers=None, layout="multiindex"):
+    """
+    Reads all the sink particle files (mtSinkXXXXNYY.ev) in a directory into a single Evdf.
+
+    XXXX is the sink number and YY the restart number. All files are parsed in parallel in a
+    process pool, the restarts of each sink are stitched as in evstitch, and the sinks are
+    combined into one frame.
+
+    Parameters
+    ----------
+    directory : str
+        Directory containing the mtSink*.ev files.
+
+    max_workers : int, optional, default=None
+        Number of worker processes. Default is the number of processors. If 1, files are read
+        serially in the current process.
+
+    layout : {'multiindex', 'long'}, optional, default='multiindex'
+        'multiindex' returns a frame indexed by (sink, time), with sink the number in the file
+        name. 'long' returns a frame with a RangeIndex and an extra 'sink' column, sorted by
+        sink and time.
+
+    Returns
+    -------
+    evdf : Evdf
+        Data of all sinks, with the physical quantities and units of the files (also for 'time'
+        when it is an index level).
+
+    Raises
+    ------
+    ValueError
+        If a column has different physical quantities or units in different files.
+    """
+    if layout not in ("multiindex", "long"):
+        raise ValueError(f"Invalid layout '{layout}'. Options are 'multiindex' and 'long'")
+
+    sink_files = {}
+    for filename in sorted(glob.glob(os.path.join(os.fspath(directory), "mtSink*N*.ev"))):
+        match = re.search(r"mtSink(\d+)N(\d+)\.ev$", filename)
+        if match is not None:
+            sink_files.setdefault(int(match.group(1)), []).append((int(match.group(2)), filename))
+    if not sink_files:
+        raise FileNotFoundError(f"No mtSink*.ev files found in '{directory}'")
+
+    sinks = sorted(sink_files)
+    filenames = [f for sink in sinks for _, f in sorted(sink_files[sink])]
+    evdfs = iter(_read_evfiles(filenames, max_workers=max_workers))
+
+    stitched = []
+    for sink in sinks:
+        sink_evdf = _stitch_evdfs([next(evdfs) for _ in sink_files[sink]])
+        sink_evdf.insert(0, "sink", sink)
+        stitched.append(sink_evdf)
+
+    metadata = _merged_metadata(stitched)
+    evdf = Evdf(pd.concat(stitched, ignore_index=True))
+    if layout == "multiindex":
+        evdf = evdf.set_index(["sink", "time"])
+    evdf.assign_default_quants_units()
+    _set_metadata(evdf, metadata)
+    return evdf
+
+
+def _ev_file_kind(filename):
+    """Returns the kind of an .ev file: its name without the extension and the restart number."""
+    stem = re.sub(r"\.ev(\.(gz|bz2|xz))?$", "", os.path.basename(filename))
+    return re.sub(r"(N\d+|\d+)$", "", stem) or stem
+
+
+class EvArchive:
+    """
+    Columnar archive of the .ev files of a directory, loaded back without parsing any text.
+
+    The archive is a directory with two files: a raw little-endian float64 data file, where the
+    data of each .ev file is stored as one (ncols, nrows) block of contiguous columns, and a JSON
+    index. The index records for each file its name, run, kind, number of rows, time span, byte
+    offset in the data file and its layout: the headers and the phys_quantity, units and
+    conv_value attributes, stored once for all the files that share them. The data file is memory
+    mapped (copy-on-write) per Evdf, so loading an Evdf only reads the pages of the selected
+    columns and rows, and never opens the original .ev files.
+
+    Files are identified by their path relative to the packed directory. The run of a file is the
+    directory that contains it (relative to the packed directory, '.' for the top level) and its
+    kind is the name without the extension and restart number (e.g. 'energy', or 'mtSink0001'
+    for mtSink0001N02.ev), unless another kind function is given to pack. The time of each file
+    is its first column.
+
+    Parameters
+    ----------
+    path : str
+        Directory of an archive written by EvArchive.pack.
+
+    Examples
+    --------
+    >>> archive = EvArchive.pack("simulations", "simulations.evarchive")
+    >>> archive.index.loc[("run1", "energy")]
+    >>> evdfs = archive.load(kind="energy", usecols=["time", "total energy"], time_range=(0, 1e4))
+    """
+
+    index_name = "index.json"
+    data_name = "data.f8"
+    # Alignment of the data blocks in the data file, in float64 items (64 bytes)
+    block_alignment = 8
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(os.path.join(self.path, self.index_name), "r") as f:
+            meta = json.load(f)
+        self.layouts = []
+        for layout in meta["layouts"]:
+            attrs = {k: phev.units.FrozenDict(v) for k, v in layout["attrs"].items()}
+            self.layouts.append((layout["headers"], attrs))
+        self.entries = {entry["name"]: entry for entry in meta["entries"]}
+
+    @classmethod
+    def pack(cls, directory, path, pattern="**/*.ev", kind=None, max_workers=None, batch_size=64):
+        """
+        Packs the .ev files of a directory into an archive and returns it.
+
+        Parameters
+        ----------
+        directory : str
+            Directory with the .ev files, which are parsed with evreader.
+
+        path : str
+            Directory of the archive. An archive already in it is replaced.
+
+        pattern : str, optional, default='**/*.ev'
+            Glob pattern of the files to pack, relative to directory. The default includes the
+            .ev files in all subdirectories.
+
+        kind : callable, optional, default=None
+            Function returning the kind of a file from its path. Default is the file name
+            without the extension and the restart number.
+
+        max_workers : int, optional, default=None
+            Number of worker processes that parse the files. See evstitch.
+
+        batch_size : int, optional, default=64
+            Number of files parsed at a time, which bounds the memory used while packing.
+
+        Returns
+        -------
+        archive : EvArchive
+            The packed archive.
+        """
+        directory = os.fspath(directory)
+        path = os.fspath(path)
+        if kind is None:
+            kind = _ev_file_kind
+        filenames = sorted(
+            f for f in glob.glob(os.path.join(directory, pattern), recursive=True) if os.path.isfile(f)
+        )
+        os.makedirs(path, exist_ok=True)
+
+        layouts, layout_ids, entries = [], {}, []
+        offset = 0
+        data_path = os.path.join(path, cls.data_name)
+        tmp_path = data_path + f".{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(filenames), batch_size):
+                    batch = filenames[start : start + batch_size]
+                    for filename, evdf in zip(batch, _read_evfiles(batch, max_workers=max_workers)):
+                        name = os.path.relpath(filename, directory).replace(os.sep, "/")
+                        non_numeric = [h for h, dtype in evdf.dtypes.items() if dtype != np.float64]
+                        if non_numeric:
+                            raise ValueError(f"Columns {non_numeric} of '{filename}' are not numeric")
+                        headers = list(evdf.keys())
+                        attrs = {
+                            attr: dict(evdf.attrs[attr])
+                            for attr in ("phys_quantity", "units", "conv_value")
+                            if attr in evdf.attrs
+                        }
+                        layout_key = json.dumps([headers, attrs], default=float)
+                        if layout_key not in layout_ids:
+                            layout_ids[layout_key] = len(layouts)
+                            layouts.append({"headers": headers, "attrs": attrs})
+
+                        # Columns are written contiguously, as the single block of an Evdf
+                        block = np.ascontiguousarray(evdf.to_numpy().T, dtype="<f8")
+                        f.write(block.tobytes())
+                        times = block[0] if len(headers) else np.empty(0)
+                        finite_times = times[np.isfinite(times)]
+                        entries.append(
+                            {
+                                "name": name,
+                                "run": os.path.dirname(name) or ".",
+                                "kind": kind(filename),
+                                "layout": layout_ids[layout_key],
+                                "offset": offset,
+                                "nrows": len(evdf),
+                                "t_min": float(finite_times.min()) if len(finite_times) else None,
+                                "t_max": float(finite_times.max()) if len(finite_times) else None,
+                                "time_sorted": bool(np.all(np.diff(times) >= 0)),
+                            }
+                        )
+                        offset += block.size
+                        padding = -offset % cls.block_alignment
+                        f.write(bytes(8 * padding))
+                        offset += padding
+            os.replace(tmp_path, data_path)
+
+            meta = {"layouts": layouts, "entries": entries}
+            index_path = os.path.join(path, cls.index_name)
+            tmp_path = index_path + f".{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f, default=float)
+            os.replace(tmp_path, index_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return cls(path)
+
+    @property
+    def index(self):
+        """
+        Returns the index of the archive as a DataFrame indexed by (run, kind, t_min) and sorted,
+        with the name, number of rows and time span of each file.
+        """
+        index = pd.DataFrame(
+            [
+                (e["run"], e["kind"], e["t_min"], e["t_max"], e["nrows"], e["name"])
+                for e in self.entries.values()
+            ],
+            columns=["run", "kind", "t_min", "t_max", "nrows", "name"],
+        )
+        return index.set_index(["run", "kind", "t_min"]).sort_index()
+
+    def select(self, run=None, kind=None, time_range=None):
+        """
+        Returns the names of the files of the given runs and kinds (single values or lists) whose
+        time span overlaps the closed interval time_range, sorted by run, kind and time.
+        """
+        runs = [run] if isinstance(run, str) else run
+        kinds = [kind] if isinstance(kind, str) else kind
+        selected = []
+        for entry in self.entries.values():
+            if runs is not None and entry["run"] not in runs:
+                continue
+            if kinds is not None and entry["kind"] not in kinds:
+                continue
+            if time_range is not None and (
+                entry["t_min"] is None
+                or entry["t_max"] < time_range[0]
+                or entry["t_min"] > time_range[1]
+            ):
+                continue
+            selected.append(entry)
+        selected.sort(key=lambda e: (e["run"], e["kind"], -np.inf if e["t_min"] is None else e["t_min"]))
+        return [entry["name"] for entry in selected]
+
+    def load_file(self, name, usecols=None, time_range=None):
+        """
+        Returns the Evdf of a file of the archive.
+
+        Parameters
+        ----------
+        name : str
+            Path of the file relative to the packed directory, as in the index.
+
+        usecols : list of str or int, optional, default=None
+            Columns to load, given as header names or 1-based column numbers. See evreader.
+
+        time_range : tuple of float, optional, default=None
+            Closed interval (t0, t1) of the first column (time) to load. The index of the
+            returned rows is their row number in the file, as in evreader.
+
+        Returns
+        -------
+        evdf : Evdf
+            Data of the file with its physical quantities and units. Without usecols, the Evdf
+            wraps the memory-mapped block, and only the pages that are read are loaded.
+        """
+        if name not in self.entries:
+            raise KeyError(f"File '{name}' not found in archive '{self.path}'")
+        entry = self.entries[name]
+        headers, attrs = self.layouts[entry["layout"]]
+        nrows = entry["nrows"]
+        if len(headers) and nrows:
+            # Each Evdf has its own copy-on-write mapping, so changing it does not change others
+            block = np.memmap(
+                os.path.join(self.path, self.data_name),
+                dtype="<f8",
+                mode="c",
+                offset=8 * entry["offset"],
+                shape=(len(headers), nrows),
+            )
+        else:
+            block = np.empty((len(headers), nrows))
+
+        index = pd.RangeIndex(nrows)
+        if time_range is not None:
+            times = block[0]
+            if entry["time_sorted"]:
+                first = np.searchsorted(times, time_range[0], side="left")
+                last = np.searchsorted(times, time_range[1], side="right")
+                block = block[:, first:last]
+                index = index[first:last]
+            else:
+                mask = (times >= time_range[0]) & (times <= time_range[1])
+                block = block[:, mask]
+                index = index[mask]
+
+        col_indices = _resolve_usecols(headers, usecols)
+        if col_indices is not None:
+            block = block[col_indices]
+            headers = [headers[i] for i in col_indices]
+            attrs = {
+                attr: phev.units.FrozenDict({h: values[h] for h in headers if h in values})
+                for attr, values in attrs.items()
+            }
+
+        evdf = Evdf(block.T, index=index, columns=headers, copy=False)
+        evdf.attrs.update(attrs)
+        return evdf
+
+    def load(self, run=None, kind=None, usecols=None, time_range=None):
+        """
+        Returns a dictionary {name: Evdf} of the files selected by run, kind and time_range (see
+        select), with the given columns and rows (see load_file). With usecols, files without
+        all the selected columns are skipped.
+        """
+        evdfs = {}
+        for name in self.select(run=run, kind=kind, time_range=time_range):
+            try:
+                evdfs[name] = self.load_file(name, usecols=usecols, time_range=time_range)
+            except ValueError:
+                if usecols is None:
+                    raise
+        return evdfs
+
+    def unpack(self, directory, precision=None):
+        """
+        Writes the files of the archive back to .ev files in a directory with evwriter, keeping
+        their relative paths. Returns the list of written files.
+        """
+        written = []
+        for name in self.entries:
+            filename = os.path.join(os.fspath(directory), *name.split("/"))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            written.append(evwriter(self.load_file(name), filename, precision=precision))
+        return written
+
+
+class EvFollower:
+    """
+    Follows an .ev file that is still being written by Phantom.
+
+    The follower remembers the byte offset up to which the file has been parsed. Each call to
+    poll parses only the complete lines appended since the previous call, so refreshing costs
+    time proportional to the new data. A partially written last line is left for the next poll.
+    If the file is truncated or replaced by a shorter one, it is read again from the start.
+
+    The parsed rows are kept in a float64 buffer that grows geometrically. The Evdf returned
+    by poll and evdf is a read-only view of that buffer; use its copy method to modify it.
+    If a restart writes a new header line, the following rows are parsed with its columns;
+    new columns are added to the buffer and filled with NaN for the earlier rows.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .ev file.
+
+    pheaders : bool, optional, default=False
+        If True, prints the column names when the header line is first read.
+
+    Examples
+    --------
+    >>> follower = EvFollower("mtSink0001N01.ev")
+    >>> evdf = follower.poll()  # whole file
+    >>> evdf = follower.poll()  # only rows appended since the previous poll are parsed
+    """
+
+    def __init__(self, filename, pheaders=False):
+        self.filename = filename
+        self.pheaders = pheaders
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.headers = None
+        self.nrows = 0
+        self._segment_headers = None
+        self._buffer = None
+        self._attrs = None
+
+    def _append(self, data, headers):
+        """
+        Appends a 2-D float array of rows with the given column names to the buffer, doubling
+        its capacity when needed and adding the columns that are not in the buffer yet.
+        """
+        new_headers = [h for h in dict.fromkeys(headers) if h not in self.headers]
+        nrows = self.nrows + len(data)
+        if self._buffer is None or nrows > len(self._buffer) or new_headers:
+            capacity = len(self._buffer) if self._buffer is not None else 0
+            if nrows > capacity:
+                capacity = max(nrows, 2 * capacity, 1024)
+            buffer = np.empty((capacity, len(self.headers) + len(new_headers)), dtype=np.float64)
+            if self._buffer is not None:
+                buffer[: self.nrows, : len(self.headers)] = self._buffer[: self.nrows]
+                buffer[: self.nrows, len(self.headers) :] = np.nan
+            self._buffer = buffer
+        if new_headers:
+            self.headers = self.headers + new_headers
+            self._attrs = _build_evdf(self.headers, np.empty((len(self.headers), 0))).attrs
+
+        if headers == self.headers:
+            self._buffer[self.nrows : nrows] = data
+        else:
+            self._buffer[self.nrows : nrows] = np.nan
+            for j, h in enumerate(headers):
+                self._buffer[self.nrows : nrows, self.headers.index(h)] = data[:, j]
+        self.nrows = nrows
+
+    def poll(self):
+        """
+        Parses the complete lines appended to the file since the previous poll.
+
+        Returns
+        -------
+        evdf : Evdf or None
+            All rows parsed so far, or None if the header line has not been written yet.
+        """
+        if os.path.getsize(self.filename) < self.offset:
+            self._reset()
+
+        with open(self.filename, "rb") as f:
+            f.seek(self.offset)
+            new_bytes = f.read()
+        end = new_bytes.rfind(b"\n") + 1
+        if end == 0:
+            return self.evdf
+        self.offset += end
+        text = new_bytes[:end].decode()
+
+        if self.headers is None:
+            header_line, text = text.split("\n", 1)
+            self.headers = self._segment_headers = _parse_headers(header_line)
+            if self.pheaders == True:
+                print(self.headers)
+            self._attrs = _build_evdf(self.headers, np.empty((len(self.headers), 0))).attrs
+
+        if _has_header_lines(text):
+            segments = _split_segments(text, self._segment_headers)
+        else:
+            segments = [(self._segment_headers, text)]
+        for headers, body in segments:
+            lines = body.split("\n")
+            try:
+                data = _parse_body(lines, len(headers))
+            except ValueError:
+                columns = _parse_body_fields(lines, len(headers))
+                data = np.column_stack(
+                    [pd.to_numeric(col, errors="coerce") for col in columns]
+                )
+                warnings.warn(
+                    f"Non-numeric fields in '{self.filename}' were stored as NaN.", stacklevel=2
+                )
+            self._append(data, headers)
+        self._segment_headers = segments[-1][0]
+        return self.evdf
+
+    @property
+    def evdf(self):
+        """Returns all rows parsed so far as an Evdf, or None if the header line has not been read yet."""
+        if self.headers is None:
+            return None
+        data = self._buffer[: self.nrows]
+        data.flags.writeable = False
+        evdf = Evdf(data, columns=self.headers, copy=False)
+        evdf.attrs.update(self._attrs)
+        return evdf
+
+
+def _minmax_indices(y, bins):
+    """
+    Returns the sorted indices of the first, last, minimum and maximum points of each of bins
+    consecutive buckets of y (of equal number of points), ignoring NaN.
+    """
+    n = len(y)
+    size = -(-n // bins)
+    nbuckets = -(-n // size)
+    padded = np.full(nbuckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(nbuckets, size)
+    nan = np.isnan(padded)
+    starts = np.arange(nbuckets) * size
+    imin = np.where(nan, np.inf, padded).argmin(axis=1) + starts
+    imax = np.where(nan, -np.inf, padded).argmax(axis=1) + starts
+    ends = np.minimum(starts + size, n) - 1
+    return np.unique(np.concatenate([starts, ends, np.minimum(imin, n - 1), np.minimum(imax, n - 1)]))
+
+
+def _lttb_indices(x, y, bins):
+    """
+    Returns the indices of the points kept by the Largest-Triangle-Three-Buckets algorithm: the
+    first and last points, and in each of bins buckets the point that forms the largest
+    triangle with the point kept in the previous bucket and the mean of the next bucket.
+    """
+    n = len(y)
+    edges = np.linspace(1, n - 1, bins + 1).astype(np.int64)
+    keep = np.empty(bins + 2, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(bins):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 <= bins else n
+        next_x = np.nanmean(x[hi:next_hi]) if next_hi > hi else x[-1]
+        next_y = np.nanmean(y[hi:next_hi]) if next_hi > hi else y[-1]
+        area = np.abs(
+            (x[previous] - next_x) * (y[lo:hi] - y[previous])
+            - (x[previous] - x[lo:hi]) * (next_y - y[previous])
+        )
+        previous = lo + np.argmax(np.where(np.isnan(area), -1.0, area)) if hi > lo else lo
+        keep[i + 1] = previous
+    return np.unique(keep)
+
+
+def decimate(x, y, bins, method="minmax"):
+    """
+    Reduces a series to about the resolution of a plot, keeping its peaks.
+
+    Parameters
+    ----------
+    x, y : array-like
+        Coordinates of the points, with x sorted.
+
+    bins : int
+        Number of buckets of consecutive points, typically the width of the plot in pixels.
+
+    method : {'minmax', 'lttb'}, optional, default='minmax'
+        'minmax' keeps the first, last, minimum and maximum points of each bucket (up to 4 per
+        bucket), so the plotted line covers the same pixels as the full series. 'lttb' keeps one
+        point per bucket with the Largest-Triangle-Three-Buckets algorithm, which keeps the shape
+        of the curve with fewer points.
+
+    Returns
+    -------
+    x, y : numpy.ndarray
+        Coordinates of the kept points. Series that are already small enough are returned whole.
+    """
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f"Invalid method '{method}'. Options are 'minmax' and 'lttb'")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bins = max(int(bins), 1)
+    if len(y) <= (4 * bins if method == "minmax" else bins + 2):
+        return x, y
+    if method == "minmax":
+        indices = _minmax_indices(y, bins)
+    else:
+        indices = _lttb_indices(x, y, bins)
+    return x[indices], y[indices]
+
+
+def _axis_label(evdf, column_keys):
+    """Returns the axis label of columns of an Evdf from their physical quantity and units."""
+    labels = []
+    for column_key in column_keys:
+        quantity = evdf.column_physical_quantity(column_key) if "phys_quantity" in evdf.attrs else None
+        units = evdf.column_units(column_key) if "units" in evdf.attrs else None
+        if quantity in (None, "Unknown quantity"):
+            quantity = column_key
+        label = quantity if units in (None, "Unknown units") else f"{quantity} [{units}]"
+        if label not in labels:
+            labels.append(label)
+    return ", ".join(labels)
+
+
 class constants:
     mass = 1.989e33
     time = 1.594e3
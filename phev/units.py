@@ -1,5 +1,6 @@
 """This module contains all data realted to the physical quantities, units and conversion rate for the columns of a Evdf object."""
 
+import functools
 import numpy as np
 
 
@@ -55,6 +56,10 @@ kgm_s = kilograms * m_s
 gcms2 = peneru
 kgms2 = kilograms * m_s**2
 
+# Specific energy units
+erg_g = pvu**2
+j_kg = m_s**2
+
 # Angular momentum units
 gcm2_s = gcm_s * centimeters
 kgm2_s = kgm_s * meters
@@ -147,6 +152,16 @@ momentum_dict = {
 energy_dict = {"Null": 1, "ph. energy units": 1, "erg": gcms2, "J": kgms2}
 
 
+spener_dict = {
+    "Null": 1,
+    "ph. specific energy units": 1,
+    "erg/g": erg_g,
+    "cgs": erg_g,
+    "J/kg": j_kg,
+    "mks": j_kg,
+}
+
+
 angmom_dict = {
     "Null": 1,
     "ph. angular momentum units": 1,
@@ -165,10 +180,54 @@ phys_quantities_dict = {
     "density": density_dict.keys(),
     "momentum": momentum_dict.keys(),
     "energy": energy_dict.keys(),
+    "specific energy": spener_dict.keys(),
     "angular momentum": angmom_dict.keys(),
 }
 
 
+# Unit dictionary of each physical quantity. Unlike merged_units_dict, it resolves
+# unit names shared by several quantities (e.g. 'cgs' or 'mks').
+quantity_units_dicts = {
+    "time": time_dict,
+    "mass": mass_dict,
+    "distance": distance_dict,
+    "velocity": velocity_dict,
+    "density": density_dict,
+    "momentum": momentum_dict,
+    "energy": energy_dict,
+    "specific energy": spener_dict,
+    "angular momentum": angmom_dict,
+}
+
+
+# Units of each physical quantity in the unit systems known by Evdf.convert_unit_system
+unit_systems = {
+    "phantom": {quant: f"ph. {quant} units" for quant in phys_quantities_dict},
+    "cgs": {
+        "time": "s",
+        "mass": "g",
+        "distance": "cm",
+        "velocity": "cm/s",
+        "density": "g/cm^3",
+        "momentum": "g cm/s",
+        "energy": "erg",
+        "specific energy": "erg/g",
+        "angular momentum": "g cm^2/s",
+    },
+    "mks": {
+        "time": "s",
+        "mass": "kg",
+        "distance": "m",
+        "velocity": "m/s",
+        "density": "kg/m^3",
+        "momentum": "kg m/s",
+        "energy": "J",
+        "specific energy": "J/kg",
+        "angular momentum": "kg m^2/s",
+    },
+}
+
+
 merged_units_dict = {
     **time_dict,
     **mass_dict,
@@ -177,10 +236,135 @@ merged_units_dict = {
     **density_dict,
     **momentum_dict,
     **energy_dict,
+    **spener_dict,
     **angmom_dict,
 }
 
 
+# Column names (or name endings) of ev files that hold particle counts or identifiers
+count_column_keys = ["sink ID", "nptmass", "npart", "nsink"]
+count_column_suffixes = ["num part"]
+
+
+@functools.lru_cache(maxsize=1024)
+def is_count_column(column_key):
+    """Returns True if the column name of an Evdf corresponds to a particle count or identifier."""
+    return column_key in count_column_keys or any(
+        column_key.endswith(suffix) for suffix in count_column_suffixes
+    )
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict used for the column metadata stored in the attrs of Evdf objects.
+
+    Copies and deep copies return the same object, so pandas can propagate the attrs of an
+    Evdf through slices, filters and arithmetic without copying the metadata. Use updated to
+    get a new FrozenDict with some entries changed.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read-only, use updated() to get a modified copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    update = pop = popitem = clear = setdefault = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def updated(self, mapping):
+        """Returns a new FrozenDict with the entries of mapping added or replaced."""
+        return FrozenDict({**self, **mapping})
+
+
+time_default_quants_units = ("time", "ph. time units", time_dict["ph. time units"])
+mass_default_quants_units = ("mass", "ph. mass units", mass_dict["ph. mass units"])
+distance_default_quants_units = (
+    "distance",
+    "ph. distance units",
+    distance_dict["ph. distance units"],
+)
+velocity_default_quants_units = (
+    "velocity",
+    "ph. velocity units",
+    velocity_dict["ph. velocity units"],
+)
+density_default_quants_units = (
+    "density",
+    "ph. density units",
+    density_dict["ph. density units"],
+)
+energy_default_quants_units = (
+    "energy",
+    "ph. energy units",
+    energy_dict["ph. energy units"],
+)
+momentum_default_quants_units = (
+    "momentum",
+    "ph. momentum units",
+    momentum_dict["ph. momentum units"],
+)
+angmom_default_quants_units = (
+    "angular momentum",
+    "ph. angular momentum units",
+    angmom_dict["ph. angular momentum units"],
+)
+spener_default_quants_units = (
+    "specific energy",
+    "ph. specific energy units",
+    spener_dict["ph. specific energy units"],
+)
+dimensionless_default_quants_units = ("dimensionless", "dimensionless", 1.0)
+unknown_default_quants_units = ("Unknown quantity", "Unknown units", 1.0)
+
+
+# Default physical quantity, units and conversion rate of the known ev column names
+default_quants_units_dict = {
+    "time": time_default_quants_units,
+    "dt": time_default_quants_units,
+    "mass": mass_default_quants_units,
+    "macc": mass_default_quants_units,
+    "x": distance_default_quants_units,
+    "y": distance_default_quants_units,
+    "z": distance_default_quants_units,
+    "xcom": distance_default_quants_units,
+    "ycom": distance_default_quants_units,
+    "zcom": distance_default_quants_units,
+    "vx": velocity_default_quants_units,
+    "vy": velocity_default_quants_units,
+    "vz": velocity_default_quants_units,
+    "vrms": velocity_default_quants_units,
+    "rho ave": density_default_quants_units,
+    "rhomax": density_default_quants_units,
+    "emag": energy_default_quants_units,
+    "epot": energy_default_quants_units,
+    "ekin": energy_default_quants_units,
+    "erad": energy_default_quants_units,
+    "etherm": energy_default_quants_units,
+    "total energy": energy_default_quants_units,
+    "totmom": momentum_default_quants_units,
+    "totmomall": momentum_default_quants_units,
+    "angmom": angmom_default_quants_units,
+    "angall": angmom_default_quants_units,
+    # Orbital quantities computed by phev.orbits
+    "separation": distance_default_quants_units,
+    "relative velocity": velocity_default_quants_units,
+    "specific orbital energy": spener_default_quants_units,
+    "semi-major axis": distance_default_quants_units,
+    "eccentricity": dimensionless_default_quants_units,
+    "orbital period": time_default_quants_units,
+}
+
+
 def phys_quants_units_default(column_key):
     '''
     This function reads the column name of Evdf object and writes the default values for
@@ -204,69 +388,31 @@ def phys_quants_units_default(column_key):
         This is the reason why all units are label as `ph. X units` and the conversion rate is always 1.
       
     '''
-    time_default_quants_units = ["time", "ph. time units", time_dict["ph. time units"]]
-    mass_default_quants_units = ["mass", "ph. mass units", mass_dict["ph. mass units"]]
-    distance_default_quants_units = [
-        "distance",
-        "ph. distance units",
-        distance_dict["ph. distance units"],
-    ]
-    velocity_default_quants_units = [
-        "velocity",
-        "ph. velocity units",
-        velocity_dict["ph. velocity units"],
-    ]
-    density_default_quants_units = [
-        "density",
-        "ph. density units",
-        density_dict["ph. density units"],
-    ]
-    energy_default_quants_units = [
-        "energy",
-        "ph. energy units",
-        energy_dict["ph. energy units"],
-    ]
-    momentum_default_quants_units = [
-        "momentum",
-        "ph. momentum units",
-        momentum_dict["ph. momentum units"],
-    ]
-    angmom_default_quants_units = [
-        "angular momentum",
-        "ph. angular momentum units",
-        angmom_dict["ph. angular momentum units"],
-    ]
+    return list(default_quants_units_dict.get(column_key, unknown_default_quants_units))
+
+
+@functools.lru_cache(maxsize=1024)
+def columns_metadata(column_keys):
+    """
+    Returns the default metadata of a set of Evdf columns as three shared FrozenDicts mapping
+    each column name to its physical quantity, units and conversion rate.
 
-    quant_dict = {
-        "time": time_default_quants_units,
-        "dt": time_default_quants_units,
-        "mass": mass_default_quants_units,
-        "macc": mass_default_quants_units,
-        "x": distance_default_quants_units,
-        "y": distance_default_quants_units,
-        "z": distance_default_quants_units,
-        "xcom": distance_default_quants_units,
-        "ycom": distance_default_quants_units,
-        "zcom": distance_default_quants_units,
-        "vx": velocity_default_quants_units,
-        "vy": velocity_default_quants_units,
-        "vz": velocity_default_quants_units,
-        "vrms": velocity_default_quants_units,
-        "rho ave": density_default_quants_units,
-        "rhomax": density_default_quants_units,
-        "emag": energy_default_quants_units,
-        "epot": energy_default_quants_units,
-        "ekin": energy_default_quants_units,
-        "erad": energy_default_quants_units,
-        "etherm": energy_default_quants_units,
-        "total energy": energy_default_quants_units,
-        "totmom": momentum_default_quants_units,
-        "totmomall": momentum_default_quants_units,
-        "angmom": angmom_default_quants_units,
-        "angall": angmom_default_quants_units,
-    }
-
-    if column_key in quant_dict.keys():
-        return quant_dict[column_key]
-    else:
-        return ["Unknown quantity", "Unknown units", 1.0]
+    Results are cached per tuple of column names, so all Evdfs read from files with the same
+    headers share the same metadata objects.
+
+    Parameters
+    ----------
+    column_keys : tuple of str
+        Column names of the Evdf.
+
+    Returns
+    -------
+    phys_quantity, units, conv_value : FrozenDict
+    """
+    quants_units = [
+        default_quants_units_dict.get(column_key, unknown_default_quants_units)
+        for column_key in column_keys
+    ]
+    return tuple(
+        FrozenDict(zip(column_keys, values)) for values in zip(*quants_units)
+    ) or (FrozenDict(), FrozenDict(), FrozenDict())
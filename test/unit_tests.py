@@ -1,10 +1,24 @@
+import asyncio
+import gc
+import io
+import os
+import subprocess
+import sys
+import time
+import warnings
 import pytest
 import numpy as np
+import pandas as pd
 from pathlib import Path
 import phev.phev 
+import phev.orbits
 import phev.units
 
 
+def final_separation(evdf, column="sep. 1"):
+    return evdf[column].iloc[-1]
+
+
 @pytest.fixture
 def select_evfile(request):
     """Fixture that returns a full path to the requested EV file."""
@@ -109,3 +123,730 @@ class TestPhev:
             warning_new_conv_val=False,
         )
         assert np.array_equal(evdf_converted_to_dropbears["x"].values, evdf["x"].values)
+
+    def test_fast_parser_matches_field_parser(self, get_all_evfiles):
+        for evfile in get_all_evfiles:
+            with open(evfile) as f:
+                raw_data = f.read().split("\n")
+            ncols = len(phev.phev._parse_headers(raw_data[0]))
+            fast_columns = phev.phev._parse_body(raw_data[1:], ncols).T
+            slow_columns = phev.phev._parse_body_fields(raw_data[1:], ncols)
+            for fast, slow in zip(fast_columns, slow_columns):
+                assert np.array_equal(fast, slow, equal_nan=True)
+
+    def test_non_numeric_fields_kept_as_strings(self, tmp_path):
+        evfile = tmp_path / "bad.ev"
+        evfile.write_text("# [ 1 time]   [ 2 mass]\n 1.0 2.0\n 3.0 abc\n")
+        evdf = phev.phev.evreader(evfile, pheaders=False)
+        assert evdf["time"].dtype == np.float64
+        assert list(evdf["mass"]) == ["2.0", "abc"]
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev", "mtSink0001N01.ev"], indirect=True)
+    def test_iter_evreader_chunks(self, select_evfile):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        chunks = list(phev.phev.iter_evreader(select_evfile, chunksize=100, pheaders=False))
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert all(chunk.attrs == evdf.attrs for chunk in chunks)
+        pd.testing.assert_frame_equal(pd.concat(chunks), evdf, check_exact=True)
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_evcache_roundtrip(self, select_evfile, tmp_path):
+        cache = phev.phev.EvCache(tmp_path / "cache")
+        evdf = phev.phev.evreader(select_evfile, pheaders=False, cache=cache)
+        assert len(cache.entries()) == 1
+        cached_evdf = phev.phev.evreader(select_evfile, pheaders=False, cache=cache)
+        assert isinstance(cached_evdf, phev.phev.Evdf)
+        assert cached_evdf.attrs == evdf.attrs
+        pd.testing.assert_frame_equal(cached_evdf, evdf, check_exact=True)
+
+    def test_evcache_append_during_parse(self, tmp_path, monkeypatch):
+        evfile = tmp_path / "energy.ev"
+        evfile.write_text(Path("./data/energy.ev").read_text())
+        nrows = len(phev.phev.evreader(evfile, pheaders=False))
+        cache = phev.phev.EvCache(tmp_path / "cache")
+        parse_body, file_digest = phev.phev._parse_body, phev.phev._file_digest
+        digests = []
+
+        def parse_while_appending(lines, *args, **kwargs):
+            data = parse_body(lines, *args, **kwargs)
+            with open(evfile, "a") as f:
+                f.write(" ".join(["1.0"] * 24) + "\n")
+            return data
+
+        monkeypatch.setattr(phev.phev, "_parse_body", parse_while_appending)
+        monkeypatch.setattr(phev.phev, "_file_digest", lambda *args: digests.append(1) or file_digest(*args))
+        assert len(phev.phev.evreader(evfile, pheaders=False, cache=cache)) == nrows
+        assert len(digests) == 1
+        monkeypatch.undo()
+        # The rows parsed before the append are not returned for the appended file
+        assert cache.load(evfile) is None
+        assert len(phev.phev.evreader(evfile, pheaders=False, cache=cache)) == nrows + 1
+
+    def test_evcache_invalidation_and_eviction(self, tmp_path):
+        evfile = tmp_path / "energy.ev"
+        evfile.write_text(Path("./data/energy.ev").read_text())
+        cache = phev.phev.EvCache(tmp_path / "cache")
+        cache.hash_block_size = 4096
+        phev.phev.evreader(evfile, pheaders=False, cache=cache)
+        with open(evfile, "a") as f:
+            f.write(" ".join(["1.0"] * 24) + "\n")
+        assert cache.load(evfile) is None
+        evdf = phev.phev.evreader(evfile, pheaders=False, cache=cache)
+        assert evdf["time"].iloc[-1] == 1.0
+        assert len(cache.entries()) == 2
+
+        cache.size_limit = max(size for _, size, _ in cache.entries())
+        cache.evict()
+        assert len(cache.entries()) == 1
+        assert cache.load(evfile) is not None
+
+        # An edit in the middle of the file that keeps its size and modification time
+        stat = evfile.stat()
+        data = bytearray(evfile.read_bytes())
+        middle = data.index(b"E", len(data) // 2) - 1
+        data[middle] = ord("9") if data[middle] != ord("9") else ord("8")
+        evfile.write_bytes(bytes(data))
+        os.utime(evfile, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert cache.load(evfile) is None
+
+    def test_evfollower_partial_lines(self, tmp_path):
+        lines = Path("./data/mtSink0001N01.ev").read_text().splitlines(keepends=True)
+        evfile = tmp_path / "mtSink0001N01.ev"
+        evfile.write_text(lines[0][:20])
+        follower = phev.phev.EvFollower(evfile)
+        assert follower.poll() is None
+
+        with open(evfile, "a") as f:
+            f.write("".join(lines[0][20:]) + "".join(lines[1:1000]) + lines[1000][:30])
+        evdf = follower.poll()
+        assert len(evdf) == 999
+
+        with open(evfile, "a") as f:
+            f.write(lines[1000][30:] + "".join(lines[1001:]))
+        evdf = follower.poll()
+        full_evdf = phev.phev.evreader(evfile, pheaders=False)
+        assert evdf.attrs == full_evdf.attrs
+        pd.testing.assert_frame_equal(evdf, full_evdf, check_exact=True)
+        assert follower.offset == evfile.stat().st_size
+
+    @pytest.mark.parametrize("max_workers", [1, 2])
+    def test_evstitch_overlapping_restarts(self, tmp_path, max_workers):
+        lines = Path("./data/energy.ev").read_text().splitlines(keepends=True)
+        header, body = lines[0], lines[1:]
+        for i, (start, end) in enumerate([(0, 120), (100, 250), (240, len(body))]):
+            (tmp_path / f"energy{i + 1:02d}.ev").write_text(header + "".join(body[start:end]))
+
+        evdf = phev.phev.evstitch(tmp_path / "energy*.ev", max_workers=max_workers)
+        full_evdf = phev.phev.evreader("./data/energy.ev", pheaders=False)
+        assert isinstance(evdf, phev.phev.Evdf)
+        assert evdf.attrs == full_evdf.attrs
+        pd.testing.assert_frame_equal(evdf, full_evdf, check_exact=True)
+
+    @pytest.mark.parametrize("layout", ["multiindex", "long"])
+    def test_sinkreader(self, tmp_path, layout):
+        lines = Path("./data/mtSink0001N01.ev").read_text().splitlines(keepends=True)
+        (tmp_path / "mtSink0001N01.ev").write_text("".join(lines[:1001]))
+        (tmp_path / "mtSink0001N02.ev").write_text(lines[0] + "".join(lines[990:]))
+        (tmp_path / "mtSink0002N01.ev").write_text("".join(lines[:501]))
+
+        evdf = phev.phev.sinkreader(tmp_path, max_workers=1, layout=layout)
+        sink1 = phev.phev.evreader("./data/mtSink0001N01.ev", pheaders=False)
+        assert isinstance(evdf, phev.phev.Evdf)
+        assert len(evdf) == len(sink1) + 500
+        assert evdf.column_units("time") == "ph. time units"
+        assert evdf.column_units("x") == "ph. distance units"
+        if layout == "multiindex":
+            assert list(evdf.index.names) == ["sink", "time"]
+            assert np.array_equal(evdf.loc[1]["x"].to_numpy(), sink1["x"].to_numpy())
+        else:
+            assert np.array_equal(evdf[evdf["sink"] == 2]["x"].to_numpy(), sink1["x"].to_numpy()[:500])
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_usecols(self, select_evfile, tmp_path):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        usecols_evdf = phev.phev.evreader(
+            select_evfile, pheaders=False, usecols=["time", 18, "total energy"]
+        )
+        assert list(usecols_evdf.keys()) == ["time", "total energy", "tot ang mom"]
+        assert list(usecols_evdf.attrs["units"]) == ["time", "total energy", "tot ang mom"]
+        pd.testing.assert_frame_equal(
+            usecols_evdf, evdf[["time", "total energy", "tot ang mom"]], check_exact=True
+        )
+        chunks = phev.phev.iter_evreader(select_evfile, pheaders=False, usecols=["time"])
+        assert list(next(chunks).keys()) == ["time"]
+        with pytest.raises(ValueError):
+            phev.phev.evreader(select_evfile, pheaders=False, usecols=["unicorn_mass"])
+        cache = phev.phev.EvCache(tmp_path / "cache")
+        phev.phev.evreader(select_evfile, pheaders=False, cache=cache)
+        cached_evdf = phev.phev.evreader(
+            select_evfile, pheaders=False, cache=cache, usecols=["time", 18]
+        )
+        assert cached_evdf.attrs["units"] == {"time": "ph. time units", "tot ang mom": "Unknown units"}
+
+    def test_time_index_window(self, tmp_path):
+        evfile = tmp_path / "separation_vs_time.ev"
+        evfile.write_text(Path("./data/separation_vs_time.ev").read_text())
+        index = phev.phev.EvTimeIndex.open(evfile, stride=100)
+        assert Path(phev.phev.EvTimeIndex.sidecar_path(evfile)).exists()
+        assert phev.phev.EvTimeIndex.load(evfile).stride == 100
+
+        evdf = phev.phev.evreader(evfile, pheaders=False)
+        for t0, t1 in [(1.2e5, 1.5e5), (-1.0, 5e3), (3.7e5, 1e9), (1e9, 2e9), (100.0, 100.0)]:
+            window = phev.phev.evreader(
+                evfile, pheaders=False, time_range=(t0, t1), usecols=["sep. 1"]
+            )
+            expected = evdf[(evdf["time"] >= t0) & (evdf["time"] <= t1)][["sep. 1"]]
+            pd.testing.assert_frame_equal(window, expected, check_exact=True, check_index_type=False)
+            assert list(window.attrs["units"]) == ["sep. 1"]
+
+        with open(evfile, "a") as f:
+            f.write(" 1.0E+06  0.0  0.0  0.0  1.0\n")
+        assert phev.phev.EvTimeIndex.load(evfile) is None
+        assert len(phev.phev.evreader(evfile, pheaders=False, time_range=(9e5, 2e6))) == 1
+
+    @pytest.mark.parametrize("select_evfile", ["mtSink0001N01.ev"], indirect=True)
+    def test_compact_dtypes(self, select_evfile):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        compact_evdf = phev.phev.evreader(
+            select_evfile, pheaders=False, float32=["distance", "vx"], integers=True
+        )
+        assert compact_evdf["sink ID"].dtype == np.int32
+        assert compact_evdf["nptmass"].dtype == np.int32
+        assert compact_evdf["x"].dtype == np.float32
+        assert compact_evdf["vx"].dtype == np.float32
+        assert compact_evdf["vy"].dtype == np.float64
+        assert compact_evdf["time"].dtype == np.float64
+        assert np.array_equal(compact_evdf["x"], evdf["x"].to_numpy().astype(np.float32))
+        assert compact_evdf.attrs == evdf.attrs
+
+        evdf.compact_dtypes(float32=True, integers=False)
+        assert evdf["sink ID"].dtype == np.float32
+        assert evdf["time"].dtype == np.float64
+
+    def test_strict_mode(self, tmp_path):
+        evfile = tmp_path / "bad.ev"
+        evfile.write_text("# [ 1 time]   [ 2 mass]\n 1.0 2.0\n 3.0 abc\n")
+        with pytest.raises(ValueError):
+            phev.phev.evreader(evfile, pheaders=False, strict=True)
+        with pytest.raises(ValueError):
+            list(phev.phev.iter_evreader(evfile, pheaders=False, strict=True))
+
+    def test_count_columns(self):
+        assert phev.units.is_count_column("sink ID")
+        assert phev.units.is_count_column("ub num part")
+        assert not phev.units.is_count_column("ub mass")
+
+    @pytest.mark.parametrize("select_evfile", ["mtSink0001N01.ev"], indirect=True)
+    def test_convert_unit_system(self, select_evfile):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        cgs_evdf = evdf.copy()
+        cgs_evdf.convert_unit_system("cgs")
+        assert cgs_evdf.column_units("vx") == "cm/s"
+        assert cgs_evdf.column_units("sink ID") == "Unknown units"
+        assert np.array_equal(cgs_evdf["vx"].values, evdf["vx"].values * phev.units.cm_s)
+        assert np.array_equal(cgs_evdf["time"].values, evdf["time"].values * phev.units.seconds)
+
+        cgs_evdf.convert_unit_system({"time": "yr", "mass": "m_sun", "x": ("dropbears", 2.0)})
+        assert cgs_evdf.column_units("time") == "yr"
+        assert cgs_evdf.column_conversion_rate("x") == 2.0
+        assert np.allclose(cgs_evdf["time"].values, evdf["time"].values * phev.units.years, rtol=1e-14)
+        assert np.allclose(cgs_evdf["x"].values, evdf["x"].values * 2.0, rtol=1e-14)
+
+        with pytest.raises(ValueError):
+            cgs_evdf.convert_unit_system({"time": "yr", "vx": "parsecs"})
+        assert cgs_evdf.column_units("vx") == "cm/s"
+
+        # The single block of the Evdf is scaled as a whole, without changing frames that share it
+        assert cgs_evdf._mgr.nblocks == 1
+        time_column = cgs_evdf["time"]
+        time_values = time_column.to_numpy().copy()
+        cgs_evdf.convert_unit_system("mks")
+        assert cgs_evdf._mgr.nblocks == 1
+        assert cgs_evdf.column_units("time") == "s"
+        assert np.array_equal(time_column.to_numpy(), time_values)
+
+    @pytest.mark.parametrize("select_evfile", ["mtSink0001N01.ev"], indirect=True)
+    def test_lazy_units(self, select_evfile):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        lazy_evdf = evdf.copy()
+        lazy_evdf.set_lazy_units()
+        raw_time = lazy_evdf.iloc[:, 0].to_numpy()
+
+        lazy_evdf.convert_units(column_key="time", new_units="yr")
+        lazy_evdf.convert_unit_system({"x": "au", "vx": "km/s"})
+        assert np.array_equal(pd.DataFrame.__getitem__(lazy_evdf, "time").to_numpy(), raw_time)
+        assert np.array_equal(lazy_evdf["time"].values, raw_time * phev.units.years)
+        assert np.array_equal(lazy_evdf.iloc[:, 0].to_numpy(), lazy_evdf["time"].to_numpy())
+        assert lazy_evdf.loc[1, "x"] == lazy_evdf.at[1, "x"] == lazy_evdf.iat[1, 1] == lazy_evdf["x"][1]
+        assert lazy_evdf["time"] is lazy_evdf["time"]
+        assert lazy_evdf.column_units("time") == "yr"
+
+        for units in ["days", "hr", "yr", "ph. time units"]:
+            lazy_evdf.convert_units(column_key="time", new_units=units)
+        assert np.array_equal(lazy_evdf["time"].values, raw_time)
+
+        eager_evdf = evdf.copy()
+        eager_evdf.convert_unit_system({"x": "au", "vx": "km/s"})
+        materialized = lazy_evdf.materialize_units()
+        assert not materialized.lazy_units
+        assert lazy_evdf.lazy_units
+        assert materialized.attrs == eager_evdf.attrs
+        pd.testing.assert_frame_equal(materialized, eager_evdf, check_exact=True)
+
+        # Exports and whole-frame operations see the current units, not the stored data
+        np.testing.assert_array_equal(lazy_evdf.to_numpy(), eager_evdf.to_numpy())
+        np.testing.assert_array_equal(lazy_evdf.values, eager_evdf.values)
+        assert lazy_evdf.to_csv() == eager_evdf.to_csv()
+        pd.testing.assert_frame_equal(lazy_evdf.describe(), eager_evdf.describe())
+        pd.testing.assert_series_equal(lazy_evdf.max(), eager_evdf.max())
+        pd.testing.assert_frame_equal(lazy_evdf * 2, eager_evdf * 2, check_exact=True)
+
+        # Assigned values are taken in the current units
+        assigned_evdf = lazy_evdf.copy()
+        assigned_evdf["time"] = assigned_evdf["time"] + 0.0
+        np.testing.assert_array_equal(assigned_evdf["time"], lazy_evdf["time"])
+        pd.testing.assert_frame_equal(assigned_evdf.materialize_units(), lazy_evdf.materialize_units())
+        assigned_evdf.convert_unit_system({"x": "km"})
+        assigned_evdf["x"]
+        assigned_evdf.iloc[0, 1] = 100.0
+        assert assigned_evdf["x"].iloc[0] == 100.0 and assigned_evdf.column_units("x") == "km"
+        assert assigned_evdf["x"].iloc[1] == eager_evdf["x"].iloc[1] * phev.units.kilometers / phev.units.au
+
+        compact_evdf = lazy_evdf.copy()
+        compact_evdf.compact_dtypes(float32=["x"])
+        np.testing.assert_allclose(compact_evdf["x"], eager_evdf["x"], rtol=1e-6)
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_shared_metadata_registry(self, select_evfile):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        other_evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        assert evdf.attrs["units"] is other_evdf.attrs["units"]
+        assert evdf.iloc[:10].attrs["units"] is evdf.attrs["units"]
+        assert (evdf * 2).attrs["conv_value"] is evdf.attrs["conv_value"]
+        with pytest.raises(TypeError):
+            evdf.attrs["units"]["time"] = "yr"
+
+        evdf.convert_units(column_key="time", new_units="yr")
+        assert evdf.column_units("time") == "yr"
+        assert other_evdf.column_units("time") == "ph. time units"
+        assert phev.units.phys_quants_units_default("x") == ["distance", "ph. distance units", 1]
+
+    def test_repair_fortran_fields(self, tmp_path):
+        evfile = tmp_path / "fortran.ev"
+        evfile.write_text(
+            "# [ 1 time]   [ 2 rhomax]   [ 3 mass]\n"
+            "   1.0E+00   2.500000000E-05   1.0E+00\n"
+            "   2.0E+00   1.234567890-105   NaN\n"
+            "   3.0E+00   *************   1.5D+03\n"
+            "   4.0E+00   4.0E-02   -Infinity\n"
+        )
+        with pytest.warns(UserWarning):
+            evdf = phev.phev.evreader(evfile, pheaders=False, repair=True)
+        assert all(evdf[col].dtype == np.float64 for col in evdf.keys())
+        assert evdf["rhomax"].iloc[1] == 1.234567890e-105
+        assert np.isnan(evdf["rhomax"].iloc[2])
+        assert evdf["mass"].iloc[2] == 1.5e3
+        assert evdf["mass"].iloc[3] == -np.inf
+        assert dict(evdf.attrs["repaired_values"]) == {"rhomax": 2, "mass": 1}
+
+        with pytest.warns(UserWarning):
+            chunks = list(phev.phev.iter_evreader(evfile, chunksize=2, pheaders=False, repair=True))
+        pd.testing.assert_frame_equal(pd.concat(chunks), evdf, check_exact=True)
+        assert phev.phev.evreader(evfile, pheaders=False)["rhomax"].dtype != np.float64
+
+    def test_multi_segment_file(self, tmp_path):
+        lines = Path("./data/separation_vs_time.ev").read_text().splitlines(keepends=True)
+        new_header = "#   [ 1         time]     [ 2    x sep. 1 ]     [ 3 unicorn_mass ]\n"
+        new_rows = ["  %.11E  %.11E  %.11E\n" % (1e6 + i, -1.0 * i, 2.0 * i) for i in range(50)]
+        evfile = tmp_path / "segments.ev"
+        evfile.write_text("".join(lines[:201]) + lines[0] + "".join(lines[201:301]) + new_header + "".join(new_rows))
+
+        evdf = phev.phev.evreader(evfile, pheaders=False)
+        assert list(evdf.keys()) == ["time", "x sep. 1", "y sep. 1", "z sep. 1", "sep. 1", "unicorn_mass"]
+        assert len(evdf) == 350
+        assert all(evdf[col].dtype == np.float64 for col in evdf.keys())
+        assert evdf["sep. 1"].iloc[300:].isna().all()
+        assert evdf["unicorn_mass"].iloc[:300].isna().all()
+        assert evdf.column_units("time") == "ph. time units"
+        full_evdf = phev.phev.evreader("./data/separation_vs_time.ev", pheaders=False)
+        assert np.array_equal(evdf["x sep. 1"].to_numpy()[:300], full_evdf["x sep. 1"].to_numpy()[:300])
+
+        usecols_evdf = phev.phev.evreader(evfile, pheaders=False, usecols=["time", "sep. 1"])
+        assert list(usecols_evdf.keys()) == ["time", "sep. 1"]
+        assert len(usecols_evdf) == 350
+
+        # Without the time column, the header lines are still detected and never read as data
+        usecols_evdf = phev.phev.evreader(evfile, pheaders=False, usecols=["y sep. 1"])
+        assert len(usecols_evdf) == 350
+        np.testing.assert_array_equal(usecols_evdf["y sep. 1"].iloc[:300], full_evdf["y sep. 1"].iloc[:300])
+        chunks = list(phev.phev.iter_evreader(evfile, chunksize=30, pheaders=False, usecols=["y sep. 1"]))
+        assert sum(len(chunk) for chunk in chunks) == 350
+
+        chunks = list(phev.phev.iter_evreader(evfile, chunksize=30, pheaders=False))
+        assert sum(len(chunk) for chunk in chunks) == 350
+        assert list(chunks[-1].keys()) == ["time", "x sep. 1", "unicorn_mass"]
+
+        follower = phev.phev.EvFollower(evfile)
+        followed_evdf = follower.poll()
+        pd.testing.assert_frame_equal(followed_evdf, evdf, check_exact=True)
+
+    @pytest.mark.parametrize("select_evfile", ["separation_vs_time.ev", "energy.ev"], indirect=True)
+    def test_parallel_parse(self, select_evfile, monkeypatch):
+        monkeypatch.setattr(phev.phev, "parallel_min_bytes", 1024)
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        parallel_evdf = phev.phev.evreader(select_evfile, pheaders=False, workers=3)
+        assert parallel_evdf.attrs == evdf.attrs
+        pd.testing.assert_frame_equal(parallel_evdf, evdf, check_exact=True)
+        usecols_evdf = phev.phev.evreader(select_evfile, pheaders=False, workers=2, usecols=[1, 3])
+        pd.testing.assert_frame_equal(usecols_evdf, evdf.iloc[:, [0, 2]], check_exact=True)
+
+    def test_parallel_parse_clean_stderr(self):
+        # The resource tracker reports its errors on the stderr of its own process
+        code = (
+            "import phev.phev\n"
+            "phev.phev.parallel_min_bytes = 1024\n"
+            "for _ in range(5):\n"
+            "    phev.phev.evreader('./data/energy.ev', pheaders=False, workers=3)\n"
+        )
+        env = {**os.environ, "PYTHONPATH": str(Path(phev.__file__).resolve().parents[1])}
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        assert result.returncode == 0
+        assert result.stderr == ""
+
+    def test_parallel_parse_fallback(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(phev.phev, "parallel_min_bytes", 16)
+        evfile = tmp_path / "bad.ev"
+        evfile.write_text("# [ 1 time]   [ 2 mass]\n" + " 1.0 2.0\n" * 20 + " 3.0 abc\n")
+        evdf = phev.phev.evreader(evfile, pheaders=False, workers=2)
+        assert list(evdf["mass"])[-1] == "abc"
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_single_block_without_copy(self, select_evfile):
+        with open(select_evfile) as f:
+            headers = phev.phev._parse_headers(f.readline())
+            data = phev.phev._parse_body(f, len(headers))
+        evdf = phev.phev._build_evdf(headers, data.T)
+        assert np.shares_memory(evdf.to_numpy(), data)
+        assert evdf.attrs == phev.phev.evreader(select_evfile, pheaders=False).attrs
+
+    def test_evwriter_roundtrip(self, get_all_evfiles, tmp_path):
+        for evfile in get_all_evfiles:
+            evdf = phev.phev.evreader(evfile, pheaders=False)
+            written = phev.phev.evwriter(evdf, tmp_path / evfile.name, chunksize=7)
+            pd.testing.assert_frame_equal(
+                phev.phev.evreader(written, pheaders=False), evdf, check_exact=True
+            )
+            if evfile.name == "energy.ev":
+                original = evfile.read_text().split("\n", 1)[1]
+                assert written.read_text().split("\n", 1)[1] == original
+
+        extreme = phev.phev.Evdf({"time": [1.0, 2.0, 3.0, 4.0], "x": [1e300, np.inf, np.nan, -1e-300]})
+        extreme.assign_default_quants_units()
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            written = phev.phev.evwriter(extreme, tmp_path / "extreme.ev")
+        pd.testing.assert_frame_equal(phev.phev.evreader(written, pheaders=False), extreme, check_exact=True)
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_evwriter_units(self, select_evfile, tmp_path):
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        evdf.convert_unit_system("cgs")
+        evfile = phev.phev.evwriter(evdf, tmp_path / "cgs.ev", units=True)
+        read_evdf = phev.phev.evreader(evfile, pheaders=False)
+        pd.testing.assert_frame_equal(read_evdf, evdf, check_exact=True)
+        assert read_evdf.attrs == evdf.attrs
+        assert len(evfile.read_text().split("\n")[1]) == 25 * len(evdf.keys())
+        with pytest.raises(ValueError):
+            phev.phev.evwriter(evdf.assign(label="a"), tmp_path / "bad.ev")
+
+    def test_stitch_keeps_units(self, tmp_path):
+        sink = phev.phev.evreader("./data/mtSink0001N01.ev", pheaders=False)
+        cgs_sink = sink.copy()
+        cgs_sink.convert_unit_system("cgs")
+        phev.phev.evwriter(cgs_sink.iloc[:1000], tmp_path / "mtSink0001N01.ev", units=True)
+        phev.phev.evwriter(cgs_sink.iloc[1000:], tmp_path / "mtSink0001N02.ev", units=True)
+        shifted = sink.assign(x=sink["x"] + 10.0)
+        shifted.convert_unit_system("cgs")
+        phev.phev.evwriter(shifted, tmp_path / "mtSink0002N01.ev", units=True)
+
+        evdf = phev.phev.evstitch(tmp_path / "mtSink0001N*.ev", max_workers=1)
+        assert evdf.attrs == cgs_sink.attrs
+        sinks = phev.phev.sinkreader(tmp_path, max_workers=1)
+        assert sinks.column_units("time") == "s" and sinks.column_units("x") == "cm"
+        orbits = phev.orbits.sink_orbits(sinks)
+        np.testing.assert_allclose(orbits["time"], sink["time"], rtol=1e-12)
+        np.testing.assert_allclose(orbits["separation"], 10.0, rtol=1e-9)
+
+        phev.phev.evwriter(sink, tmp_path / "mtSink0002N01.ev", units=True)
+        with pytest.raises(ValueError):
+            phev.phev.sinkreader(tmp_path, max_workers=1)
+
+    def test_evarchive(self, tmp_path):
+        for run, names in {"run1": ["energy.ev", "mtSink0001N01.ev"], "run2": ["energy.ev"]}.items():
+            (tmp_path / "sim" / run).mkdir(parents=True)
+            for name in names:
+                (tmp_path / "sim" / run / name).write_bytes((Path("./data") / name).read_bytes())
+        archive = phev.phev.EvArchive.pack(tmp_path / "sim", tmp_path / "sim.evarchive", max_workers=1)
+        archive = phev.phev.EvArchive(tmp_path / "sim.evarchive")
+        assert list(archive.index.index.get_level_values("kind")) == ["energy", "mtSink0001", "energy"]
+        assert archive.select(kind="energy") == ["run1/energy.ev", "run2/energy.ev"]
+        assert archive.select(time_range=(1e4, 2e4)) == ["run1/energy.ev", "run2/energy.ev"]
+
+        for name in archive.entries:
+            evdf = archive.load_file(name)
+            read_evdf = phev.phev.evreader(tmp_path / "sim" / name, pheaders=False)
+            pd.testing.assert_frame_equal(evdf, read_evdf, check_exact=True)
+            assert evdf.attrs == read_evdf.attrs
+
+        usecols, time_range = ["time", "kin energy"], (400.0, 2000.0)
+        evdfs = archive.load(run="run1", usecols=usecols, time_range=time_range)
+        read_evdf = phev.phev.evreader(
+            tmp_path / "sim/run1/energy.ev", pheaders=False, usecols=usecols, time_range=time_range
+        )
+        assert list(evdfs) == ["run1/energy.ev"]
+        pd.testing.assert_frame_equal(evdfs["run1/energy.ev"], read_evdf, check_exact=True)
+        assert evdfs["run1/energy.ev"].attrs == read_evdf.attrs
+
+        evdf = archive.load_file("run1/energy.ev")
+        evdf.iloc[0, 0] = 5.0
+        assert archive.load_file("run1/energy.ev").iloc[0, 0] == 0.0
+        written = archive.unpack(tmp_path / "unpacked")
+        assert (tmp_path / "unpacked/run1/energy.ev").read_text().split("\n", 1)[1] == (
+            tmp_path / "sim/run1/energy.ev"
+        ).read_text().split("\n", 1)[1]
+        assert len(written) == 3
+
+        (tmp_path / "sim/run2/bad.ev").write_text("# [ 1 time]   [ 2 mass]\n 1.0 abc\n")
+        with pytest.raises(ValueError):
+            phev.phev.EvArchive.pack(tmp_path / "sim", tmp_path / "bad.evarchive", max_workers=1)
+        assert list((tmp_path / "bad.evarchive").iterdir()) == []
+
+    def test_evalign(self):
+        energy = phev.phev.evreader("./data/energy.ev", pheaders=False)
+        separation = phev.phev.evreader("./data/separation_vs_time.ev", pheaders=False)
+        evdfs = {"energy": energy, "separation": separation}
+
+        aligned = phev.phev.evalign(evdfs, dt=100.0, columns=["total energy", "sep. 1"])
+        assert list(aligned.keys()) == ["time", "total energy", "sep. 1"]
+        assert aligned["time"].iloc[1] == 100.0 and aligned["time"].iloc[-1] <= energy["time"].iloc[-1]
+        expected = np.interp(aligned["time"], separation["time"], separation["sep. 1"])
+        np.testing.assert_allclose(aligned["sep. 1"], expected, rtol=1e-14)
+        assert aligned.column_units("total energy") == energy.column_units("total energy")
+
+        asof = phev.phev.evalign(evdfs, grid="separation", method="asof", columns=["total energy"])
+        expected = pd.merge_asof(separation[["time"]], energy[["time", "total energy"]], on="time")
+        np.testing.assert_array_equal(asof["total energy"], expected["total energy"])
+
+        default = phev.phev.evalign([energy, energy.iloc[::2]])
+        np.testing.assert_array_equal(default["time"], energy["time"])
+        np.testing.assert_allclose(default["0/kin energy"], energy["kin energy"], rtol=1e-14)
+        np.testing.assert_array_equal(default["1/kin energy"].iloc[::2], energy["kin energy"].iloc[::2])
+
+        gappy = phev.phev.Evdf({"time": [0.0, 1.0, 2.0, 3.0], "q": [10.0, 11.0, np.nan, 13.0]})
+        aligned = phev.phev.evalign([gappy], grid=[1.0, 1.5, 3.0])
+        np.testing.assert_array_equal(aligned["q"], [11.0, np.nan, 13.0])
+
+    @pytest.mark.parametrize("method", ["minmax", "lttb"])
+    def test_decimated_plot(self, method):
+        times = np.arange(100000, dtype=float)
+        energy = np.sin(times / 5000.0)
+        energy[54321] = 10.0
+        evdf = phev.phev.Evdf({"time": times, "total energy": energy})
+        evdf.assign_default_quants_units()
+
+        x, y = phev.phev.decimate(times, energy, 200, method=method)
+        assert len(x) <= 4 * 200 and x[0] == 0 and x[-1] == times[-1]
+        assert 54321 in x and y.max() == 10.0
+
+        ax = evdf.evplot("total energy", bins=200, method=method)
+        assert ax.get_xlabel() == "time [ph. time units]"
+        assert ax.get_ylabel() == "energy [ph. energy units]"
+        assert ax.lines[0].get_ydata().max() == 10.0
+        ax.set_xlim(50000, 60000)
+        assert ax.lines[0].get_xdata()[0] >= 49999 and 54321 in ax.lines[0].get_xdata()
+        phev.phev.plt.close(ax.figure)
+
+    @pytest.mark.parametrize("select_evfile", ["energy.ev"], indirect=True)
+    def test_evdiagnostics(self, select_evfile):
+        columns = ["total energy", "tot ang mom", "unbound mass"]
+        diagnostics = phev.phev.evdiagnostics(
+            select_evfile, columns=columns, thresholds={"unbound mass": 1e-6}, chunksize=50
+        )
+        evdf = phev.phev.evreader(select_evfile, pheaders=False)
+        assert sorted(diagnostics.index) == sorted(["time"] + columns)
+        for column in columns:
+            values = evdf[column]
+            row = diagnostics.loc[column]
+            assert row["count"] == len(values) and row["max"] == values.max()
+            assert row["time_min"] == evdf["time"][values.idxmin()]
+            np.testing.assert_allclose(row["mean"], values.mean(), rtol=1e-12)
+            np.testing.assert_allclose(row["std"], values.std(ddof=0), rtol=1e-9)
+            if values.iloc[0] != 0:
+                drift = (values.iloc[-1] - values.iloc[0]) / abs(values.iloc[0])
+                np.testing.assert_allclose(row["drift"], drift, rtol=1e-12)
+        crossing_row = (evdf["unbound mass"] >= 1e-6).idxmax()
+        assert diagnostics.loc["unbound mass", "crossing_row"] == crossing_row
+        assert diagnostics.loc["unbound mass", "crossing_time"] == evdf["time"][crossing_row]
+
+        cgs = phev.phev.evdiagnostics(select_evfile, columns=["total energy"], units="cgs")
+        evdf.convert_unit_system("cgs")
+        assert cgs.loc["total energy", "units"] == evdf.column_units("total energy")
+        np.testing.assert_allclose(cgs.loc["total energy", "min"], evdf["total energy"].min(), rtol=1e-12)
+
+        screen = phev.phev.evscreen(
+            [select_evfile, Path("./data/separation_vs_time.ev")], max_workers=1, columns=["total energy"]
+        )
+        assert list(screen.index.get_level_values("column")) == ["time", "total energy", "time"]
+
+        # Columns missing from the file are skipped for file objects too
+        with open(select_evfile, "rb") as f:
+            from_file = phev.phev.evdiagnostics(f, columns=["total energy", "sep. 1"])
+        from_path = phev.phev.evdiagnostics(select_evfile, columns=["total energy", "sep. 1"])
+        assert sorted(from_file.index) == ["time", "total energy"]
+        pd.testing.assert_frame_equal(from_file, from_path)
+
+    def test_evensemble(self, tmp_path, monkeypatch):
+        for run in ["run_a", "run_b"]:
+            (tmp_path / run).mkdir()
+            (tmp_path / run / "separation_vs_time.ev").write_bytes(
+                Path("./data/separation_vs_time.ev").read_bytes()
+            )
+        calls = []
+        apply_reduction = phev.phev._apply_reduction
+        def counted(filename, **kwargs):
+            calls.append(filename)
+            return apply_reduction(filename, **kwargs)
+        monkeypatch.setattr(phev.phev, "_apply_reduction", counted)
+
+        pattern = str(tmp_path / "*" / "separation_vs_time.ev")
+        cache = tmp_path / "memo"
+        table = phev.phev.evensemble(pattern, final_separation, max_workers=1, cache=cache)
+        evdf = phev.phev.evreader("./data/separation_vs_time.ev", pheaders=False)
+        assert list(table.index) == ["run_a", "run_b"]
+        assert (table["final_separation"] == evdf["sep. 1"].iloc[-1]).all()
+        assert len(calls) == 2
+
+        with open(tmp_path / "run_b" / "separation_vs_time.ev", "a") as f:
+            f.write("    4.00000000000E+05    -1.00000000000E+00     0.00000000000E+00     0.00000000000E+00     1.00000000000E+00\n")
+        table = phev.phev.evensemble(pattern, final_separation, max_workers=1, cache=cache)
+        assert len(calls) == 3 and calls[-1].endswith("run_b/separation_vs_time.ev")
+        assert table.loc["run_b", "final_separation"] == 1.0
+
+        table = phev.phev.evensemble(
+            pattern, final_separation, params={"column": "x sep. 1"}, max_workers=1, cache=cache
+        )
+        assert len(calls) == 5
+        assert table.loc["run_a", "final_separation"] == evdf["x sep. 1"].iloc[-1]
+
+    def test_aevreader_overlaps_reads(self, get_all_evfiles, monkeypatch):
+        read_file_bytes = phev.phev._read_file_bytes
+        def slow_read(filename):
+            time.sleep(0.2)
+            return read_file_bytes(filename)
+        monkeypatch.setattr(phev.phev, "_read_file_bytes", slow_read)
+        paths = sorted(get_all_evfiles) * 2
+
+        async def read_all():
+            start = time.perf_counter()
+            evdfs = await phev.phev.aevreader(paths, concurrency=len(paths), max_workers=1)
+            elapsed = time.perf_counter() - start
+            completed = [path async for path, _ in phev.phev.aevreader(paths, concurrency=4, max_workers=1)]
+            return evdfs, elapsed, completed
+
+        evdfs, elapsed, completed = asyncio.run(read_all())
+        assert elapsed < 0.2 * len(paths) / 2
+        assert sorted(completed) == sorted(str(path) for path in paths)
+        for path, evdf in zip(paths, evdfs):
+            pd.testing.assert_frame_equal(evdf, phev.phev.evreader(path, pheaders=False), check_exact=True)
+
+    @pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma"])
+    def test_compressed_input(self, tmp_path, compression):
+        module = __import__(compression)
+        suffix = {"gzip": ".gz", "bz2": ".bz2", "lzma": ".xz"}[compression]
+        for evfile in [Path("./data/energy.ev"), Path("./data/mtSink0001N01.ev")]:
+            compressed = tmp_path / (evfile.name + suffix)
+            compressed.write_bytes(module.compress(evfile.read_bytes()))
+            evdf = phev.phev.evreader(evfile, pheaders=False)
+            pd.testing.assert_frame_equal(phev.phev.evreader(compressed, pheaders=False), evdf, check_exact=True)
+            with open(compressed, "rb") as f:
+                pd.testing.assert_frame_equal(phev.phev.evreader(f, pheaders=False), evdf, check_exact=True)
+            chunks = pd.concat(phev.phev.iter_evreader(compressed, chunksize=100, pheaders=False))
+            pd.testing.assert_frame_equal(chunks, evdf, check_exact=True)
+
+        # File objects without peek are wrapped for reading, but never closed
+        for data in [Path("./data/energy.ev").read_bytes(), compressed.read_bytes()]:
+            f = io.BytesIO(data)
+            phev.phev.evreader(f, pheaders=False)
+            f.seek(0)
+            list(phev.phev.iter_evreader(f, chunksize=100, pheaders=False))
+            gc.collect()
+            assert not f.closed
+
+        # Streams that cannot seek, for well-formed data and for the multi-segment fallback
+        segments = tmp_path / "segments.ev"
+        lines = Path("./data/separation_vs_time.ev").read_text().splitlines(keepends=True)
+        segments.write_text("".join(lines[:11] + lines[:1] + lines[11:21]))
+        for evfile in [Path("./data/energy.ev"), compressed, segments]:
+            with subprocess.Popen(["cat", str(evfile)], stdout=subprocess.PIPE) as process:
+                assert not process.stdout.seekable()
+                evdf = phev.phev.evreader(process.stdout, pheaders=False)
+            pd.testing.assert_frame_equal(evdf, phev.phev.evreader(evfile, pheaders=False), check_exact=True)
+
+        # The time index of a plain copy is written next to it, outside the source tree
+        plain = tmp_path / "energy.ev"
+        plain.write_bytes(Path("./data/energy.ev").read_bytes())
+        time_range, usecols = (400.0, 2000.0), ["kin energy"]
+        evdf = phev.phev.evreader(
+            tmp_path / ("energy.ev" + suffix), pheaders=False, time_range=time_range, usecols=usecols
+        )
+        expected = phev.phev.evreader(plain, pheaders=False, time_range=time_range, usecols=usecols)
+        pd.testing.assert_frame_equal(evdf, expected, check_exact=True)
+
+    def test_orbital_quantities(self, tmp_path):
+        masses = {1: 2.0, 2: 1.0, 3: 0.5}
+        times = np.arange(50, dtype=float)
+        # Pericentre of an e = 0.5 orbit around sink 1, and a circular orbit of sink 3
+        r_peri, ecc, total = 4.0, 0.5, masses[1] + masses[2]
+        positions = {1: (0.0, 0.0), 2: (r_peri, 0.0), 3: (0.0, 9.0)}
+        velocities = {1: (0.0, 0.0), 2: (0.0, np.sqrt(total * (1 + ecc) / r_peri)), 3: (np.sqrt(2.5 / 9.0), 0.0)}
+        for sink, mass in masses.items():
+            sink_evdf = phev.phev.Evdf(
+                {
+                    "time": times,
+                    "x": np.full(50, positions[sink][0]),
+                    "y": np.full(50, positions[sink][1]),
+                    "z": np.zeros(50),
+                    "mass": np.full(50, mass),
+                    "vx": np.full(50, velocities[sink][0]),
+                    "vy": np.full(50, velocities[sink][1]),
+                    "vz": np.zeros(50),
+                }
+            )
+            sink_evdf.assign_default_quants_units()
+            phev.phev.evwriter(sink_evdf.iloc[: 50 - sink], tmp_path / f"mtSink000{sink}N01.ev")
+
+        sinks = phev.phev.sinkreader(tmp_path, max_workers=1)
+        orbits = phev.orbits.sink_orbits(sinks)
+        assert list(orbits.index.unique()) == [(1, 2), (1, 3), (2, 3)]
+        assert len(orbits.loc[(1, 2)]) == 48 and len(orbits.loc[(2, 3)]) == 47
+        pair = orbits.loc[(1, 2)]
+        np.testing.assert_allclose(pair["eccentricity"], ecc, rtol=1e-12)
+        np.testing.assert_allclose(pair["semi-major axis"], r_peri / (1 - ecc), rtol=1e-12)
+        np.testing.assert_allclose(pair["orbital period"], 2 * np.pi * np.sqrt(8.0**3 / total), rtol=1e-12)
+        np.testing.assert_allclose(orbits.loc[(1, 3)]["eccentricity"], 0, atol=1e-12)
+
+        cgs = phev.orbits.sink_orbits(sinks.iloc[::-1], pairs=[(1, 2)], units="cgs")
+        assert cgs.column_units("specific orbital energy") == "erg/g"
+        assert cgs.column_units("eccentricity") == "dimensionless"
+        np.testing.assert_allclose(cgs["orbital period"], pair["orbital period"] * phev.units.seconds, rtol=1e-12)
+
+        sinks.convert_unit_system("cgs")
+        sink1, sink2 = sinks.loc[1].reset_index().iloc[:48], sinks.loc[2].reset_index()
+        sink1.attrs, sink2.attrs = sinks.attrs, sinks.attrs
+        binary = phev.orbits.binary_orbit(sink1, sink2)
+        np.testing.assert_allclose(binary["specific orbital energy"], pair["specific orbital energy"], rtol=1e-12)
+
+        separation = phev.phev.evreader("./data/separation_vs_time.ev", pheaders=False)
+        orbit = phev.orbits.separation_orbit(separation, mass=1.0)
+        np.testing.assert_allclose(orbit["separation"], separation["sep. 1"], rtol=1e-9)
+        assert orbit.column_physical_quantity("orbital period") == "time"